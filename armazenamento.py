@@ -0,0 +1,676 @@
+import os
+import copy
+import json
+import base64
+import time
+import atexit
+import logging
+import threading
+import tempfile
+import subprocess
+from collections import OrderedDict
+from urllib.parse import quote
+from github import Auth, Github, InputGitTreeElement
+from github.GitRef import GitRef
+from github.GithubException import GithubException, UnknownObjectException
+
+logger = logging.getLogger(__name__)
+
+# --- BACKENDS DE ARMAZENAMENTO ---
+# Todo backend expõe a mesma interface:
+#   ler(caminho) -> bytes ou None se o arquivo não existe
+#   ler_com_versao(caminho) -> (bytes ou None, versão) para escrita condicional
+#   escrever(caminho, conteudo, mensagem_commit, versao=None) -> com versao, falha
+#       com ConflitoEscrita se o arquivo mudou desde a leitura
+#   anexar(caminho, conteudo, mensagem_commit) -> acrescenta ao fim do arquivo
+#   esperar(caminho=None) -> bloqueia até as escritas pendentes serem gravadas; False se
+#       a última gravação falhou (as operações continuam pendentes)
+#   ler_varios(caminhos) -> ({caminho: bytes ou None}, versão) lidos no mesmo estado
+#   escrever_varios(alteracoes, mensagem_commit, versao=None) -> {caminho: conteudo}
+#       gravados juntos num único commit (tudo ou nada)
+#   transacao(alteracoes, mensagem_commit) -> [(caminho, tipo, valor)] aplicados
+#       juntos; tipo é "escrever", "anexar" ou "transformar" (ver aplicar_ops)
+
+class ConflitoEscrita(Exception):
+    pass
+
+class OperacaoInvalida(Exception):
+    # Um "transformar" que levantou exceção: só essa operação (ou a transação dela) é descartada
+    def __init__(self, op):
+        super().__init__(op[2])
+        self.op = op
+
+def _bytes(conteudo): return conteudo.encode("utf-8") if isinstance(conteudo, str) else conteudo
+
+class _Transacional:
+    tentativas = 3
+
+    def transacao(self, alteracoes, mensagem_commit):
+        lotes = {}
+        for caminho, tipo, valor in alteracoes: lotes.setdefault(caminho, []).append((tipo, valor, mensagem_commit, None))
+        for _ in range(self.tentativas):
+            try: return gravar_lotes(self, lotes, mensagem_commit)
+            except ConflitoEscrita: continue
+        raise ConflitoEscrita(", ".join(lotes))
+
+# --- CACHE DE LEITURA (GET CONDICIONAL) ---
+# LRU caminho -> (ContentFile, sha, conteúdo decodificado), uma tupla que nunca muda. Cada
+# leitura revalida o arquivo com If-None-Match (ETag) numa cópia do ContentFile: um 304
+# devolve o sha e o conteúdo guardados juntos (o mesmo objeto bytes), não baixa nem
+# decodifica nada e não conta no rate limit da API. Um 200 vira uma entrada nova.
+
+class CacheLeitura:
+    def __init__(self, capacidade=64):
+        self.capacidade = capacidade
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self.acertos = self.falhas = self.descartes = 0
+
+    def obter(self, caminho):
+        with self._lock:
+            entrada = self._entradas.get(caminho)
+            if entrada is not None: self._entradas.move_to_end(caminho)
+            return entrada
+
+    def guardar(self, caminho, arquivo, conteudo=None):
+        with self._lock:
+            self.falhas += 1
+            if conteudo is None: conteudo = arquivo.decoded_content
+            entrada = self._entradas[caminho] = (arquivo, arquivo.sha, conteudo)
+            self._entradas.move_to_end(caminho)
+            while len(self._entradas) > self.capacidade:
+                self._entradas.popitem(last=False)
+                self.descartes += 1
+            return entrada[2], entrada[1]
+
+    def acerto(self):
+        with self._lock: self.acertos += 1
+
+    def remover(self, caminho):
+        with self._lock: self._entradas.pop(caminho, None)
+
+    def metricas(self):
+        with self._lock:
+            total = self.acertos + self.falhas
+            return {"entradas": len(self._entradas), "acertos": self.acertos, "falhas": self.falhas,
+                    "descartes": self.descartes, "taxa_acerto": self.acertos / total if total else 0.0}
+
+# --- CLIENTE GITHUB ---
+# Um cliente autenticado por token em todo o processo: uma sessão HTTP (keep-alive) com
+# pool de conexões do tamanho do número de threads que gravam em paralelo. O Github e a
+# sessão do requests podem ser usados de várias threads ao mesmo tempo.
+
+_clientes = {}
+_lock_clientes = threading.Lock()
+
+def cliente_github(token, tamanho_pool=10):
+    with _lock_clientes:
+        cliente = _clientes.get(token)
+        if cliente is None: cliente = _clientes[token] = Github(auth=Auth.Token(token), pool_size=tamanho_pool)
+        return cliente
+
+class Latencias:
+    # Tempo de cada chamada à API, agrupado pelo nome da chamada
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._por_chamada = {}
+
+    def registrar(self, nome, segundos):
+        with self._lock:
+            m = self._por_chamada.setdefault(nome, {"chamadas": 0, "total": 0.0, "maximo": 0.0, "ultima": 0.0})
+            m["chamadas"] += 1
+            m["total"] += segundos
+            m["maximo"] = max(m["maximo"], segundos)
+            m["ultima"] = segundos
+
+    def metricas(self):
+        with self._lock:
+            return {nome: dict(m, media=m["total"] / m["chamadas"]) for nome, m in self._por_chamada.items()}
+
+class BackendGithub(_Transacional):
+    def __init__(self, token, nome_repo, ramo=None, capacidade_cache=64):
+        self.token = token
+        self.nome_repo = nome_repo
+        self.ramo = ramo
+        self.cache = CacheLeitura(capacidade_cache)
+        self.latencias = Latencias()
+        self._repo = None
+        self._ultimo_commit = None
+
+    def get_repo(self):
+        # lazy=True: o Repository é montado sem chamada à API e guardado para sempre
+        if self._repo is None: self._repo = cliente_github(self.token).get_repo(self.nome_repo, lazy=True)
+        return self._repo
+
+    def _chamar(self, nome, fn, *args, **kwargs):
+        inicio = time.perf_counter()
+        try: return fn(*args, **kwargs)
+        finally: self.latencias.registrar(nome, time.perf_counter() - inicio)
+
+    def _no_ramo(self, parametro): return {parametro: self.ramo} if self.ramo else {}
+
+    def _ramo(self, repo):
+        # O repo é lazy: o ramo padrão custa uma chamada, feita uma vez só
+        if self.ramo is None: self.ramo = self._chamar("get_repo", lambda: repo.default_branch)
+        return self.ramo
+
+    def _ref(self, repo): return self._chamar("get_git_ref", repo.get_git_ref, f"heads/{self._ramo(repo)}")
+
+    def ler(self, caminho): return self.ler_com_versao(caminho)[0]
+
+    def ler_com_versao(self, caminho):
+        entrada = self.cache.obter(caminho)
+        try:
+            if entrada is not None:
+                modelo, sha, conteudo = entrada
+                # update() faz o GET condicional: False = 304, o conteúdo guardado continua valendo.
+                # Ele reescreve o objeto, então roda numa cópia e a entrada compartilhada fica intacta
+                arquivo = copy.copy(modelo)
+                if not self._chamar("get_contents_condicional", arquivo.update):
+                    self.cache.acerto()
+                    return conteudo, sha
+            else:
+                arquivo = self._chamar("get_contents", self.get_repo().get_contents, caminho, **self._no_ramo("ref"))
+            # Acima de 1 MB a API de conteúdo não manda o arquivo (encoding "none"): vem pelo blob
+            conteudo = None
+            if arquivo.encoding == "none":
+                blob = self._chamar("get_git_blob", self.get_repo().get_git_blob, arquivo.sha)
+                conteudo = base64.b64decode(blob.content)
+            return self.cache.guardar(caminho, arquivo, conteudo)
+        except UnknownObjectException:
+            self.cache.remover(caminho)
+            return None, None
+
+    def escrever(self, caminho, conteudo, mensagem_commit, versao=None):
+        repo = self.get_repo()
+        try:
+            # Sem versão, o sha vem do cache (revalidação condicional, em geral um 304)
+            if versao is None: versao = self.ler_com_versao(caminho)[1]
+            if versao is None: self._chamar("create_file", repo.create_file, caminho, mensagem_commit, conteudo, **self._no_ramo("branch"))
+            else: self._chamar("update_file", repo.update_file, caminho, mensagem_commit, conteudo, versao, **self._no_ramo("branch"))
+        except GithubException as e:
+            # 409: SHA desatualizado; 422: arquivo criado por outro processo no meio do caminho
+            if e.status in (409, 422): raise ConflitoEscrita(caminho) from e
+            raise
+
+    def anexar(self, caminho, conteudo, mensagem_commit):
+        # A API de conteúdo não tem append: relê e reenvia o arquivo.
+        # Usado só em arquivos pequenos (logs que são compactados periodicamente).
+        atual, versao = self.ler_com_versao(caminho)
+        if isinstance(conteudo, str): conteudo = conteudo.encode("utf-8")
+        self.escrever(caminho, (atual or b"") + conteudo, mensagem_commit, versao)
+
+    def ler_varios(self, caminhos):
+        # A versão é o commit do ramo lido antes dos arquivos, que vêm do cache (GET condicional).
+        # Se o ramo andar no meio, o conteúdo pode ser mais novo que a versão, mas a escrita
+        # com essa versão falha (não é fast-forward) e o lote é refeito
+        versao = self._ref(self.get_repo()).object.sha
+        return {caminho: self.ler(caminho) for caminho in caminhos}, versao
+
+    def _elemento_arvore(self, repo, caminho, conteudo):
+        # Texto vai inline na árvore; binário (npz, parquet) precisa de um blob em base64 antes
+        try: return InputGitTreeElement(caminho, "100644", "blob", content=conteudo.decode("utf-8"))
+        except UnicodeDecodeError: pass
+        blob = self._chamar("create_git_blob", repo.create_git_blob, base64.b64encode(conteudo).decode("ascii"), "base64")
+        return InputGitTreeElement(caminho, "100644", "blob", sha=blob.sha)
+
+    def escrever_varios(self, alteracoes, mensagem_commit, versao=None):
+        # Git Data API: árvore nova sobre a do commit pai, commit e avanço do ramo. Com a versão
+        # de ler_varios são 3 chamadas (4 se o pai não for o último commit deste processo), mais
+        # um blob por arquivo binário; somando a leitura (get_git_ref e um GET condicional por
+        # arquivo), dois arquivos custam 6 ou 7. O ganho sobre o update_file (2 por arquivo) é
+        # gravar tudo num commit só, não o número de chamadas.
+        repo = self.get_repo()
+        if versao is None: versao = self._ref(repo).object.sha
+        pai = self._ultimo_commit
+        if pai is None or pai.sha != versao: pai = self._chamar("get_git_commit", repo.get_git_commit, versao)
+        elementos = [self._elemento_arvore(repo, caminho, _bytes(conteudo)) for caminho, conteudo in alteracoes.items()]
+        arvore = self._chamar("create_git_tree", repo.create_git_tree, elementos, pai.tree)
+        commit = self._chamar("create_git_commit", repo.create_git_commit, mensagem_commit, arvore, [pai])
+        # O ramo não é relido para conferir a versão: o PATCH sem force já recusa o que não é fast-forward
+        ref = GitRef(repo.requester, attributes={"url": f"{repo.url}/git/refs/heads/{quote(self._ramo(repo))}"}, completed=True)
+        try: self._chamar("edit_ref", ref.edit, commit.sha)
+        except GithubException as e:
+            # 422: o ramo andou desde a leitura (não é fast-forward)
+            if e.status == 422: raise ConflitoEscrita(", ".join(alteracoes)) from e
+            raise
+        self._ultimo_commit = commit
+
+    def esperar(self, caminho=None): return True
+
+
+class BackendLocal(_Transacional):
+    # Arquivos numa pasta do disco. Leituras custam o mesmo que abrir um arquivo.
+    def __init__(self, diretorio):
+        self.diretorio = os.path.abspath(diretorio)
+        self._lock = threading.Lock()
+
+    def _caminho(self, caminho): return os.path.join(self.diretorio, caminho)
+
+    def ler(self, caminho):
+        try:
+            with open(self._caminho(caminho), "rb") as f: return f.read()
+        except FileNotFoundError: return None
+
+    # Um processo só escreve na pasta, sob lock: não há conflito para detectar
+    def ler_com_versao(self, caminho): return self.ler(caminho), None
+
+    def caminho_local(self, caminho):
+        # Para quem prefere abrir o arquivo direto (ex.: memory map); None se não existe
+        destino = self._caminho(caminho)
+        return destino if os.path.exists(destino) else None
+
+    def escrever(self, caminho, conteudo, mensagem_commit=None, versao=None):
+        with self._lock: self._substituir(caminho, conteudo)
+
+    def _substituir(self, caminho, conteudo):
+        if isinstance(conteudo, str): conteudo = conteudo.encode("utf-8")
+        destino = self._caminho(caminho)
+        pasta = os.path.dirname(destino)
+        os.makedirs(pasta, exist_ok=True)
+        # Escrita atômica: arquivo temporário + rename, para leitores nunca verem meio arquivo
+        fd, tmp = tempfile.mkstemp(dir=pasta, prefix=".tmp_")
+        try:
+            with os.fdopen(fd, "wb") as f: f.write(conteudo)
+            os.chmod(tmp, os.stat(destino).st_mode if os.path.exists(destino) else 0o644)
+            os.replace(tmp, destino)
+        except:
+            if os.path.exists(tmp): os.remove(tmp)
+            raise
+
+    def ler_varios(self, caminhos): return {c: self.ler(c) for c in caminhos}, None
+
+    def escrever_varios(self, alteracoes, mensagem_commit=None, versao=None):
+        # Cada arquivo é trocado atomicamente e o lock impede que outra escrita veja o conjunto pela metade
+        with self._lock:
+            for caminho, conteudo in alteracoes.items(): self._substituir(caminho, conteudo)
+
+    def anexar(self, caminho, conteudo, mensagem_commit=None):
+        if isinstance(conteudo, str): conteudo = conteudo.encode("utf-8")
+        destino = self._caminho(caminho)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        with self._lock:
+            with open(destino, "ab") as f: f.write(conteudo)
+
+    def esperar(self, caminho=None): return True
+
+
+class BackendGitLocal(_Transacional):
+    # Repositório git bare local com a mesma semântica do BackendGithub: toda escrita é
+    # um commit no ramo e a versão é o sha do commit lido; o avanço do ramo é um
+    # compare-and-swap (update-ref com valor antigo). Permite testar o caminho
+    # transacional sem rede. Precisa do executável git.
+    def __init__(self, diretorio, ramo="main"):
+        self.diretorio = os.path.abspath(diretorio)
+        self.ramo = ramo
+        if not os.path.exists(os.path.join(self.diretorio, "HEAD")):
+            os.makedirs(self.diretorio, exist_ok=True)
+            self._git("init", "-q", "--bare", f"--initial-branch={ramo}")
+
+    def _git(self, *args, entrada=None, env=None, checar=True):
+        r = subprocess.run(["git", "--git-dir", self.diretorio, *args], input=entrada, capture_output=True, env=env)
+        if checar and r.returncode != 0: raise RuntimeError(f"git {args[0]}: {r.stderr.decode(errors='replace').strip()}")
+        return r
+
+    def _head(self): return self._git("rev-parse", "-q", "--verify", f"refs/heads/{self.ramo}", checar=False).stdout.decode().strip() or None
+
+    def _ler_em(self, versao, caminho):
+        if versao is None: return None
+        r = self._git("cat-file", "blob", f"{versao}:{caminho}", checar=False)
+        return r.stdout if r.returncode == 0 else None
+
+    def ler(self, caminho): return self._ler_em(self._head(), caminho)
+
+    def ler_com_versao(self, caminho):
+        versao = self._head()
+        return self._ler_em(versao, caminho), versao
+
+    def ler_varios(self, caminhos):
+        versao = self._head()
+        return {c: self._ler_em(versao, c) for c in caminhos}, versao
+
+    def escrever(self, caminho, conteudo, mensagem_commit=None, versao=None):
+        self.escrever_varios({caminho: conteudo}, mensagem_commit, versao)
+
+    def anexar(self, caminho, conteudo, mensagem_commit=None):
+        atual, versao = self.ler_com_versao(caminho)
+        self.escrever_varios({caminho: (atual or b"") + _bytes(conteudo)}, mensagem_commit, versao)
+
+    def escrever_varios(self, alteracoes, mensagem_commit=None, versao=None):
+        pai = versao or self._head()
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, GIT_INDEX_FILE=os.path.join(tmp, "index"),
+                       GIT_AUTHOR_NAME="BusLog", GIT_AUTHOR_EMAIL="buslog@localhost",
+                       GIT_COMMITTER_NAME="BusLog", GIT_COMMITTER_EMAIL="buslog@localhost")
+            self._git("read-tree", *([pai] if pai else ["--empty"]), env=env)
+            for caminho, conteudo in alteracoes.items():
+                blob = self._git("hash-object", "-w", "--stdin", entrada=_bytes(conteudo)).stdout.decode().strip()
+                self._git("update-index", "--add", "--cacheinfo", f"100644,{blob},{caminho}", env=env)
+            arvore = self._git("write-tree", env=env).stdout.decode().strip()
+            commit = self._git("commit-tree", arvore, *(["-p", pai] if pai else []), "-m", mensagem_commit or "Atualizacao", env=env).stdout.decode().strip()
+        # Só avança se o ramo ainda aponta para o pai (zeros: o ramo ainda não pode existir)
+        r = self._git("update-ref", f"refs/heads/{self.ramo}", commit, pai or "0" * 40, checar=False)
+        if r.returncode != 0: raise ConflitoEscrita(", ".join(alteracoes))
+
+    def esperar(self, caminho=None): return True
+
+
+def criar_backend(tipo, token=None, nome_repo=None, diretorio=None):
+    if tipo == "github": return BackendGithub(token, nome_repo)
+    if tipo == "local": return BackendLocal(diretorio or ".")
+    if tipo == "git": return BackendGitLocal(diretorio or "dados.git")
+    raise ValueError(f"Backend de armazenamento desconhecido: {tipo}")
+
+
+# --- LOG JSON (APPEND-ONLY) ---
+# Estado em JSON (snapshot base) + operações em JSON Lines no arquivo delta.
+# Cada mudança grava uma linha; de tempos em tempos o dono do log reescreve o
+# snapshot a partir do estado reconstruído e zera o delta.
+
+class LogJson:
+    def __init__(self, backend, arquivo_base, limite_compactacao=500):
+        self.backend = backend
+        self.arquivo_base = arquivo_base
+        self.arquivo_delta = arquivo_base.rsplit(".", 1)[0] + ".delta.jsonl"
+        self.limite_compactacao = limite_compactacao
+        self.tamanho_delta = 0
+        self.compactando = False
+        self._lock = threading.RLock()
+
+    def carregar(self):
+        base = self.backend.ler(self.arquivo_base)
+        base = json.loads(base.decode("utf-8")) if base else {}
+        delta = self.backend.ler(self.arquivo_delta) or b""
+        ops = [json.loads(l) for l in delta.decode("utf-8").splitlines() if l.strip()]
+        self.tamanho_delta = len(ops)
+        return base, ops
+
+    def anexar(self, op, mensagem_commit, junto=()):
+        # junto: alterações em outros arquivos, gravadas no mesmo commit que a operação
+        linha = json.dumps(op, ensure_ascii=False) + "\n"
+        with self._lock:
+            if junto: self.backend.transacao([(self.arquivo_delta, "anexar", linha), *junto], mensagem_commit)
+            else: self.backend.anexar(self.arquivo_delta, linha, mensagem_commit)
+            self.tamanho_delta += 1
+
+    def precisa_compactar(self): return not self.compactando and self.tamanho_delta >= self.limite_compactacao
+
+    def compactar(self, reconstruir, mensagem_commit):
+        # reconstruir(base, ops) -> novo estado; relido do armazenamento, não da memória
+        self.compactando = True
+        try:
+            self._compactar(reconstruir, mensagem_commit)
+        finally:
+            self.compactando = False
+
+    def _compactar(self, reconstruir, mensagem_commit):
+        with self._lock:
+            estado = reconstruir(*self.carregar())
+            self.backend.escrever(self.arquivo_base, json.dumps(estado, indent=4), mensagem_commit)
+            # Só zera o delta depois que o snapshot novo estiver gravado
+            if not self.backend.esperar(self.arquivo_base):
+                logger.error("Snapshot %s não gravado: o delta fica para a próxima compactação", self.arquivo_base)
+                return
+            self.backend.escrever(self.arquivo_delta, "", mensagem_commit)
+            self.tamanho_delta = 0
+
+
+# --- FILA DE ESCRITA (WRITE-BEHIND) ---
+# Envolve um backend e grava em segundo plano. Cada arquivo tem no máximo um worker,
+# que espera intervalo_flush segundos juntando o que chegar e grava tudo num único
+# commit. A fila de cada arquivo é limitada: quem enfileira bloqueia se ela encher.
+# Operações: ("escrever", bytes), ("anexar", bytes), ("transformar", fn(bytes|None) -> bytes|str).
+# Em conflito de SHA o lote é reaplicado sobre o conteúdo relido (até `tentativas` vezes).
+# Se a gravação falha (conflitos seguidos, erro do backend), o lote volta para o início da
+# fila e o worker tenta de novo com espera dobrando a cada falha; esperar() devolve False
+# enquanto isso. Um "transformar" que levanta exceção sai da fila sozinho (com a transação dele).
+# ler() devolve o armazenamento com as escritas pendentes já aplicadas.
+# `tempos` mede, qualquer que seja o backend, cada leitura ("ler") e cada flush ("gravar").
+# Uma transação entra na fila de cada arquivo que toca; o worker que a encontra leva
+# junto tudo o que está pendente nesses arquivos e grava num único commit.
+
+# Cada operação na fila: (tipo, valor, mensagem_commit, transação ou None)
+def aplicar_ops(atual, ops):
+    for op in ops:
+        tipo, valor = op[0], op[1]
+        if tipo == "escrever": atual = _bytes(valor)
+        elif tipo == "anexar": atual = (atual or b"") + _bytes(valor)
+        else:
+            try: atual = _bytes(valor(atual))
+            except Exception as e: raise OperacaoInvalida(op) from e
+    return atual
+
+def mensagem_lote(ops):
+    # Uma transação conta uma vez só, mesmo aparecendo na fila de vários arquivos
+    unidades = list({id(op[3] or op): op[2] for op in ops}.values())
+    if len(unidades) == 1: return unidades[0]
+    return f"{unidades[-1]} (+{len(unidades) - 1} atualizações)"
+
+def gravar_lotes(backend, lotes, mensagem_commit):
+    # lotes: caminho -> operações. Um arquivo só usa escrita condicional simples;
+    # vários são relidos na mesma versão e gravados num commit
+    if len(lotes) == 1:
+        (caminho, ops), = lotes.items()
+        if all(op[0] == "anexar" for op in ops):
+            return backend.anexar(caminho, b"".join(_bytes(op[1]) for op in ops), mensagem_commit)
+        atual, versao = backend.ler_com_versao(caminho)
+        return backend.escrever(caminho, aplicar_ops(atual, ops), mensagem_commit, versao)
+    atuais, versao = backend.ler_varios(list(lotes))
+    backend.escrever_varios({c: aplicar_ops(atuais[c], ops) for c, ops in lotes.items()}, mensagem_commit, versao)
+
+class _Transacao:
+    def __init__(self, caminhos): self.caminhos = frozenset(caminhos)
+
+class _PendentesArquivo:
+    def __init__(self):
+        self.ops = []
+        self.em_voo = []
+        self.worker = None
+        self.geracao = 0
+        self.falhas = 0
+        self.erro = None
+        self.metricas = {"flushes": 0, "commits": 0, "ops": 0, "conflitos": 0, "erros": 0, "descartadas": 0,
+                         "latencia_ultimo_flush": 0.0, "latencia_total": 0.0}
+
+class FilaEscrita:
+    def __init__(self, backend, intervalo_flush=2.0, capacidade=1000, tentativas=3, espera_maxima=60.0):
+        self.backend = backend
+        self.intervalo_flush = intervalo_flush
+        self.capacidade = capacidade
+        self.tentativas = tentativas
+        self.espera_maxima = espera_maxima
+        self.tempos = Latencias()
+        self._arquivos = {}
+        self._cond = threading.Condition()
+        atexit.register(self._encerrar)
+
+    def __getattr__(self, nome): return getattr(self.backend, nome)
+
+    def _enfileirar(self, alteracoes, mensagem_commit, transacao=None):
+        with self._cond:
+            fila = [(caminho, self._arquivos.setdefault(caminho, _PendentesArquivo())) for caminho, _, _ in alteracoes]
+            while any(len(p.ops) >= self.capacidade for _, p in fila): self._cond.wait()
+            for (caminho, tipo, valor), (_, p) in zip(alteracoes, fila):
+                p.ops.append((tipo, valor, mensagem_commit, transacao))
+                if p.worker is None:
+                    p.worker = threading.Thread(target=self._worker, args=(caminho, p), daemon=True, name=f"fila-escrita:{caminho}")
+                    p.worker.start()
+
+    def escrever(self, caminho, conteudo, mensagem_commit, versao=None): self._enfileirar([(caminho, "escrever", _bytes(conteudo))], mensagem_commit)
+    def anexar(self, caminho, conteudo, mensagem_commit): self._enfileirar([(caminho, "anexar", _bytes(conteudo))], mensagem_commit)
+    def transformar(self, caminho, fn, mensagem_commit): self._enfileirar([(caminho, "transformar", fn)], mensagem_commit)
+
+    def transacao(self, alteracoes, mensagem_commit):
+        alteracoes = [(c, t, _bytes(v) if t != "transformar" else v) for c, t, v in alteracoes]
+        self._enfileirar(alteracoes, mensagem_commit, _Transacao(c for c, _, _ in alteracoes))
+
+    def escrever_varios(self, alteracoes, mensagem_commit, versao=None):
+        self.transacao([(c, "escrever", v) for c, v in alteracoes.items()], mensagem_commit)
+
+    def _pendentes(self, caminho):
+        p = self._arquivos.get(caminho)
+        return (p.em_voo + p.ops, p.geracao) if p else ([], 0)
+
+    def ler(self, caminho):
+        while True:
+            with self._cond: ops, geracao = self._pendentes(caminho)
+            inicio = time.perf_counter()
+            try: atual = self.backend.ler(caminho)
+            finally: self.tempos.registrar("ler", time.perf_counter() - inicio)
+            with self._cond:
+                # Se um flush terminou durante a leitura, as ops em voo já estão no conteúdo lido
+                if self._pendentes(caminho)[1] != geracao: continue
+            return aplicar_ops(atual, ops) if ops else atual
+
+    def ler_com_versao(self, caminho): return self.ler(caminho), None
+
+    def ler_varios(self, caminhos): return {c: self.ler(c) for c in caminhos}, None
+
+    def caminho_local(self, caminho):
+        # Com escrita pendente o arquivo em disco está desatualizado: quem chama usa ler()
+        with self._cond:
+            if self._pendentes(caminho)[0]: return None
+        local = getattr(self.backend, "caminho_local", None)
+        return local(caminho) if local else None
+
+    def _grupo(self, caminho):
+        # Arquivos que precisam ir no mesmo commit: fecho das transações pendentes
+        grupo, pilha = {caminho}, [caminho]
+        while pilha:
+            for op in self._arquivos[pilha.pop()].ops:
+                if op[3] is None: continue
+                for outro in op[3].caminhos - grupo:
+                    grupo.add(outro)
+                    pilha.append(outro)
+        return grupo
+
+    def _worker(self, caminho, p):
+        while True:
+            time.sleep(min(self.intervalo_flush * 2 ** p.falhas, self.espera_maxima))
+            with self._cond:
+                # Outro worker pode estar gravando um arquivo do grupo: espera ele terminar
+                while p.ops and any(self._arquivos[c].em_voo for c in self._grupo(caminho)): self._cond.wait()
+                if not p.ops:
+                    p.worker = None
+                    self._cond.notify_all()
+                    return
+                lotes = {}
+                for c in self._grupo(caminho):
+                    q = self._arquivos[c]
+                    if q.ops: lotes[c], q.ops, q.em_voo = q.ops, [], q.ops
+                self._cond.notify_all()
+            erro = self._flush(lotes)
+            with self._cond:
+                for c in lotes:
+                    q = self._arquivos[c]
+                    # Falhou: o que estava em voo volta para a frente da fila, na mesma ordem
+                    if erro: q.ops = q.em_voo + q.ops
+                    q.em_voo = []
+                    q.geracao += 1
+                    q.falhas, q.erro = (q.falhas + 1, erro) if erro else (0, None)
+                self._cond.notify_all()
+
+    def _descartar(self, lotes, op):
+        # Tira a operação inválida (e o resto da transação dela) das listas em voo
+        with self._cond:
+            for c, ops in list(lotes.items()):
+                fora = [o for o in ops if o is op or (op[3] is not None and o[3] is op[3])]
+                ops[:] = [o for o in ops if not any(o is f for f in fora)]
+                self._arquivos[c].metricas["descartadas"] += len(fora)
+                if not ops: del lotes[c]
+
+    def _flush(self, lotes):
+        # -> None se gravou; senão a descrição do erro (o lote volta para a fila)
+        inicio = time.perf_counter()
+        metricas = [self._arquivos[c].metricas for c in lotes]
+        for c, m in zip(lotes, metricas):
+            m["flushes"] += 1
+            m["ops"] += len(lotes[c])
+        lotes, nomes, erro, conflitos = dict(lotes), ", ".join(lotes), None, 0
+        while lotes:
+            mensagem = mensagem_lote([op for ops in lotes.values() for op in ops])
+            try:
+                gravar_lotes(self.backend, lotes, mensagem)
+                for m in metricas: m["commits"] += 1
+                break
+            except OperacaoInvalida as e:
+                logger.exception("Operação inválida em %s descartada: %s", nomes, e.op[2])
+                self._descartar(lotes, e.op)
+            except ConflitoEscrita:
+                for m in metricas: m["conflitos"] += 1
+                conflitos += 1
+                if conflitos >= self.tentativas:
+                    erro = f"{conflitos} conflitos seguidos"
+                    break
+            except Exception as e:
+                erro = f"{type(e).__name__}: {e}"
+                logger.exception("Falha gravando %s (nova tentativa em breve)", nomes)
+                break
+        if erro:
+            for m in metricas: m["erros"] += 1
+            logger.error("%s não gravado (%s); as operações continuam na fila", nomes, erro)
+        latencia = time.perf_counter() - inicio
+        self.tempos.registrar("gravar", latencia)
+        for m in metricas:
+            m["latencia_ultimo_flush"] = latencia
+            m["latencia_total"] += latencia
+        return erro
+
+    def esperar(self, caminho=None, timeout=None):
+        # -> True quando tudo foi gravado; False se uma gravação terminada depois da chamada falhou, ou no timeout
+        limite = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            inicio = {id(p): p.geracao for p in self._arquivos.values()}
+            while True:
+                arquivos = [self._arquivos.get(caminho)] if caminho else list(self._arquivos.values())
+                if any(p and p.erro and p.geracao > inicio.get(id(p), 0) for p in arquivos): return False
+                if not any(p and (p.ops or p.em_voo) for p in arquivos): return True
+                restante = None if limite is None else limite - time.monotonic()
+                if restante is not None and restante <= 0: return False
+                self._cond.wait(restante)
+
+    def falhas(self):
+        # Arquivos com escrita pendente que não está conseguindo gravar -> último erro
+        with self._cond: return {c: p.erro for c, p in self._arquivos.items() if p.erro}
+
+    def _encerrar(self):
+        if not self.esperar():
+            logger.error("Escritas não gravadas ao encerrar: %s", ", ".join(self.falhas()))
+
+    def metricas(self):
+        with self._cond:
+            resultado = {}
+            for caminho, p in self._arquivos.items():
+                m = dict(p.metricas)
+                m["profundidade"] = len(p.ops)
+                m["latencia_media_flush"] = m.pop("latencia_total") / m["flushes"] if m["flushes"] else 0.0
+                resultado[caminho] = m
+            return resultado
+
+
+# --- LEITURAS CONCORRENTES ---
+# Um Carregador vive um rerun: cada chave roda uma vez só (pedidos repetidos recebem o mesmo
+# resultado) e chaves diferentes rodam em paralelo no pool do processo. A página pede tudo
+# o que vai ler logo no início e espera o conjunto: a latência fica perto da maior leitura,
+# não da soma delas.
+
+class Carregador:
+    def __init__(self, pool):
+        self.pool = pool
+        self._futuros = {}
+        self._lock = threading.Lock()
+
+    def antecipar(self, chave, fn, *args):
+        with self._lock:
+            futuro = self._futuros.get(chave)
+            if futuro is None: futuro = self._futuros[chave] = self.pool.submit(fn, *args)
+        return futuro
+
+    def obter(self, chave, fn, *args): return self.antecipar(chave, fn, *args).result()
+
+    def esperar(self):
+        # Espera tudo o que foi antecipado; falhas ficam registradas no log e não interrompem a página
+        with self._lock: futuros = list(self._futuros.items())
+        for chave, futuro in futuros:
+            try: futuro.result()
+            except Exception: logger.exception("Falha na leitura %s", chave)
@@ -0,0 +1,279 @@
+import sys
+import json
+import time
+import bcrypt
+import argparse
+import tempfile
+import tracemalloc
+import numpy as np
+import pandas as pd
+from datetime import date, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+import armazenamento
+import viagens_db
+import social_db
+import gamificacao
+import linhas
+import cards
+import feed
+
+# --- BENCHMARKS ---
+# Uso: python benchmark.py {clusters,formatos,app} [--tamanhos 10000 100000 1000000]
+#      python benchmark.py app [--tamanhos 1000 ... 10000000] [--formato csv|npz|parquet] [--backend local|git]
+
+def gerar_viagens_aleatorias(n, n_usuarios=None, seed=42):
+    rng = np.random.default_rng(seed)
+    n_usuarios = n_usuarios or max(10, n // 200)
+    inicio = np.datetime64("2024-01-01T00:00")
+    minutos = rng.integers(0, 2 * 365 * 24 * 60, n)
+    dt = pd.to_datetime(inicio + minutos.astype("timedelta64[m]"))
+    df = pd.DataFrame({
+        "id": [f"{i:016x}" for i in range(n)],
+        "usuario": pd.Categorical([f"user{u}" for u in rng.integers(0, n_usuarios, n)]),
+        "linha": pd.Categorical([f"Linha {l}" for l in rng.integers(0, 300, n)]),
+        "data": dt.strftime("%Y-%m-%d"),
+        "hora": dt.strftime("%H:%M"),
+        "obs": "",
+        "timestamp": "",
+        "dt": dt,
+    })
+    return df
+
+def agrupar_loop_referencia(df_viagens):
+    # Implementação anterior do agrupamento (loop Python sobre dicts), mantida para comparação
+    if df_viagens.empty: return []
+    df_viagens = df_viagens.dropna(subset=['dt'])
+    df_viagens = df_viagens.sort_values(by=['usuario', 'dt'], ascending=[True, False])
+    feed_items = []
+    for usuario, grupo_user in df_viagens.groupby('usuario', observed=True):
+        grupo_user = grupo_user.sort_values('dt', ascending=True)
+        viagens_user = grupo_user.to_dict('records')
+        if not viagens_user: continue
+        clusters = []; cluster_atual = [viagens_user[0]]
+        for i in range(1, len(viagens_user)):
+            viagem = viagens_user[i]
+            ultima = cluster_atual[-1]
+            if (viagem['dt'] - ultima['dt']) <= timedelta(hours=2): cluster_atual.append(viagem)
+            else: clusters.append(cluster_atual); cluster_atual = [viagem]
+        clusters.append(cluster_atual)
+        for cluster in clusters: feed_items.append({ "usuario": usuario, "datetime_ref": cluster[-1]['dt'], "viagens": cluster[::-1] })
+    feed_items.sort(key=lambda x: x['datetime_ref'], reverse=True)
+    return feed_items
+
+def cronometrar(fn, *args, repeticoes=1):
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        resultado = fn(*args)
+        melhor = min(melhor, time.perf_counter() - t0)
+    return melhor, resultado
+
+def bench_clusters(tamanhos):
+    print(f"{'viagens':>10} {'loop (s)':>10} {'vetorizado (s)':>15} {'só limites (s)':>15} {'clusters':>10}")
+    for n in tamanhos:
+        df = gerar_viagens_aleatorias(n)
+        t_loop, ref = cronometrar(agrupar_loop_referencia, df)
+        t_vet, itens = cronometrar(feed.agrupar_viagens_atividade, df)
+
+        def so_limites(df):
+            _, ts, grupos = viagens_db.ordenar_para_clusters(df)
+            return viagens_db.clusterizar(ts, grupos)
+        t_lim, (_, inicios, _) = cronometrar(so_limites, df, repeticoes=3)
+
+        assert len(ref) == len(itens) == len(inicios), "agrupamentos divergentes"
+        print(f"{n:>10} {t_loop:>10.3f} {t_vet:>15.3f} {t_lim:>15.4f} {len(inicios):>10}")
+
+def bench_formatos(tamanhos):
+    # Tamanho e tempo de carga (bytes -> DataFrame tipado) de cada formato, contra o CSV
+    nomes = [n for n in viagens_db.FORMATOS if n != "parquet" or viagens_db.pq is not None]
+    print(f"{'viagens':>10} {'formato':>8} {'tamanho (KB)':>13} {'vs csv':>7} {'gravar (s)':>11} {'carregar (s)':>13}")
+    for n in tamanhos:
+        df = gerar_viagens_aleatorias(n)
+        base = None
+        for nome in nomes:
+            formato = viagens_db.obter_formato(nome)
+            t_grav, conteudo = cronometrar(formato.gravar, df)
+            t_ler, lido = cronometrar(lambda: viagens_db.tipar_viagens(formato.ler(conteudo)), repeticoes=3)
+            assert np.array_equal(lido["dt"].values.astype("datetime64[ns]"), df["dt"].values.astype("datetime64[ns]")), f"{nome}: leitura divergente"
+            base = base or len(conteudo)
+            print(f"{n:>10} {nome:>8} {len(conteudo) / 1024:>13.0f} {len(conteudo) / base:>7.2f} {t_grav:>11.3f} {t_ler:>13.3f}")
+
+
+# --- DADOS SINTÉTICOS ---
+# Usuários com atividade desigual (poucos muito ativos, muitos casuais), cada um com um
+# punhado de linhas favoritas tiradas do rotasrj.json, horários concentrados nos picos da
+# manhã e da tarde, dois anos de histórico terminando hoje e follows puxados para os mais ativos.
+
+ARQUIVO_ROTAS = "rotasrj.json"
+MEDIA_VIAGENS_USUARIO = 500
+SEGUIDOS_POR_USUARIO = 20
+PESOS_FAVORITAS = np.array([0.35, 0.2, 0.13, 0.1, 0.08, 0.06, 0.05, 0.03])
+PESOS_HORAS = np.array([0.3, 0.2, 0.2, 0.2, 0.5, 2, 6, 8, 6, 3, 2, 2, 2.5, 2, 2, 3, 4, 6, 8, 6, 3, 2, 1.5, 1])
+PESOS_HORAS = PESOS_HORAS / PESOS_HORAS.sum()
+
+def nomes_linhas_rotas(arquivo=ARQUIVO_ROTAS):
+    with open(arquivo, encoding="utf-8") as f: return list(json.load(f))
+
+def gerar_base_sintetica(n, nomes_linhas, n_usuarios=None, seguidos=SEGUIDOS_POR_USUARIO, seed=42):
+    # -> (viagens no layout de viagens_db.COLUNAS, usuario -> lista de quem ele segue)
+    rng = np.random.default_rng(seed)
+    n_usuarios = n_usuarios or max(10, n // MEDIA_VIAGENS_USUARIO)
+    usuarios = np.array([f"user{u:06d}" for u in range(n_usuarios)], dtype=object)
+    atividade = rng.pareto(1.5, n_usuarios) + 1
+    atividade /= atividade.sum()
+    dono = rng.choice(n_usuarios, n, p=atividade)
+
+    # 85% das viagens numa das favoritas do usuário, o resto pela popularidade geral (Zipf)
+    n_linhas = len(nomes_linhas)
+    popularidade = 1 / np.arange(1, n_linhas + 1)
+    popularidade /= popularidade.sum()
+    ranking = rng.permutation(n_linhas)
+    favoritas = ranking[rng.choice(n_linhas, (n_usuarios, len(PESOS_FAVORITAS)), p=popularidade)]
+    linha = np.where(rng.random(n) < 0.85,
+                     favoritas[dono, rng.choice(len(PESOS_FAVORITAS), n, p=PESOS_FAVORITAS)],
+                     ranking[rng.choice(n_linhas, n, p=popularidade)])
+
+    inicio = np.datetime64(date.today() - timedelta(days=2 * 365), "m")
+    minutos = rng.integers(0, 2 * 365, n) * 1440 + rng.choice(24, n, p=PESOS_HORAS) * 60 + rng.integers(0, 60, n)
+    dt = pd.DatetimeIndex(inicio + minutos.astype("timedelta64[m]"))
+    df = pd.DataFrame({
+        "id": [f"{i:016x}" for i in range(n)],
+        "usuario": usuarios[dono],
+        "linha": np.array(nomes_linhas, dtype=object)[linha],
+        "data": dt.strftime("%Y-%m-%d"),
+        "hora": dt.strftime("%H:%M"),
+        "obs": np.where(rng.random(n) < 0.05, "Lotado", ""),
+        "timestamp": dt.strftime("%Y-%m-%d %H:%M:%S"),
+    })
+
+    # Follows com reposição e depois sem repetidos (e sem seguir a si mesmo)
+    k = min(seguidos, n_usuarios - 1)
+    alvos = rng.choice(n_usuarios, (n_usuarios, 2 * k), p=atividade)
+    seguindo = {}
+    for i, u in enumerate(usuarios):
+        seguindo[u] = [usuarios[a] for a in dict.fromkeys(alvos[i].tolist()) if a != i][:k]
+    return df, seguindo
+
+class _ViagensProntas:
+    # Faz as vezes do log antigo em ShardsViagens.migrar: shards e manifesto gravados de uma vez
+    def __init__(self, df): self.df = df
+    def carregar(self): return self.df
+
+def gravar_base_sintetica(backend, df, seguindo, formato="csv"):
+    senha = bcrypt.hashpw(b"busologo", bcrypt.gensalt(4)).decode()
+    backend.escrever("social.json", json.dumps(seguindo), "Base sintetica")
+    backend.escrever("perfil.json", json.dumps({u: {"display_name": f"Busólogo {u[4:]}", "bio": "", "avatar": "👤"} for u in seguindo}), "Base sintetica")
+    backend.escrever("usuarios.json", json.dumps({u: {"password": senha, "created_at": ""} for u in seguindo}), "Base sintetica")
+    viagens = viagens_db.tipar_viagens(df)
+    viagens_db.ShardsViagens(backend, "viagens", legado=_ViagensProntas(viagens), formato=formato).migrar()
+
+
+# --- CAMINHOS DO APP ---
+# Cada medição monta o estado num diretório temporário (sem contar tempo), executa a operação
+# uma vez cronometrada e outra com o tracemalloc ligado para o pico de memória.
+# Os stores são os mesmos do app (FilaEscrita sobre o backend local ou git), sem Streamlit.
+
+def montar_app(backend_base, nomes_linhas, formato):
+    backend = armazenamento.FilaEscrita(backend_base, intervalo_flush=0.0)
+    loja = viagens_db.LojaViagens(viagens_db.ShardsViagens(backend, "viagens", formato=formato), linhas.CatalogoLinhas(nomes_linhas))
+    grafo = social_db.GrafoSocial(armazenamento.LogJson(backend, "social.json"))
+    return SimpleNamespace(backend=backend, loja=loja, grafo=grafo, motor=feed.MotorFeed(loja))
+
+def medir(preparar, executar):
+    # -> (segundos, pico de memória em bytes)
+    estado = preparar()
+    t0 = time.perf_counter()
+    executar(estado)
+    tempo = time.perf_counter() - t0
+    estado = preparar()
+    tracemalloc.start()
+    executar(estado)
+    pico = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return tempo, pico
+
+def operacoes_app(novo_app, usuario, nomes_linhas):
+    # (nome, preparar, executar); usuario é o mais ativo da base (pior caso)
+    def carregado(usuario_carregado=None, quente=False):
+        def preparar():
+            app = novo_app()
+            app.loja.recarregar(); app.grafo.recarregar()
+            if usuario_carregado: app.loja.viagens_usuario(usuario_carregado)
+            if quente: app.motor.pagina(app.grafo.seguindo(usuario), 10)
+            return app
+        return preparar
+
+    def pagina_diario_50(app):
+        cursor = None
+        for _ in range(50): _, cursor = app.loja.pagina_diario(usuario, 10, cursor)
+
+    def com_seguidos():
+        app = carregado()()
+        return app, app.loja.viagens_de(app.grafo.seguindo(usuario))
+
+    def feed_com_antecipacao(app):
+        # Como a tela principal do app: minha partição e o mês mais novo de cada seguido em paralelo
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            carregador = armazenamento.Carregador(pool)
+            carregador.antecipar(("viagens", usuario), app.loja.viagens_usuario, usuario)
+            for u in app.grafo.seguindo(usuario): carregador.antecipar(("viagens_mes", u), app.loja.viagens_mes_recente, u)
+            app.motor.pagina(app.grafo.seguindo(usuario), 10)
+            carregador.esperar()
+
+    def salvar(app):
+        agora = pd.Timestamp.now().floor("min")
+        registro = {"id": viagens_db.gerar_id(), "usuario": usuario, "linha": nomes_linhas[0], "data": agora.strftime("%Y-%m-%d"),
+                    "hora": agora.strftime("%H:%M"), "obs": "", "timestamp": str(agora)}
+        app.loja.adicionar(registro)
+        app.loja.armazem.anexar(registro)
+        app.backend.esperar()
+
+    return [
+        ("carga (usuários + social)", novo_app, lambda app: (app.loja.recarregar(), app.grafo.recarregar())),
+        ("partição do usuário", carregado(), lambda app: app.loja.viagens_usuario(usuario)),
+        ("calcular_gamificacao", carregado(usuario), lambda app: gamificacao.calcular_gamificacao(app.loja.estatisticas(usuario), len(nomes_linhas))),
+        ("get_seguidores_count", carregado(), lambda app: (app.grafo.qtd_seguidores(usuario), app.grafo.qtd_seguindo(usuario))),
+        ("diário: 1ª página", carregado(usuario), lambda app: app.loja.pagina_diario(usuario, 10)),
+        ("diário: 50 páginas", carregado(usuario), pagina_diario_50),
+        ("diário: últimos 30 dias", carregado(usuario), lambda app: app.loja.pagina_diario(usuario, 10, desde=pd.Timestamp.now() - timedelta(days=30))),
+        ("feed: 1ª página (frio)", carregado(), lambda app: app.motor.pagina(app.grafo.seguindo(usuario), 10)),
+        ("feed: 1ª página (antecipada)", carregado(), feed_com_antecipacao),
+        ("feed: 1ª página (quente)", carregado(quente=True), lambda app: app.motor.pagina(app.grafo.seguindo(usuario), 10)),
+        ("agrupar_viagens_atividade", com_seguidos, lambda estado: feed.agrupar_viagens_atividade(estado[1])),
+        ("card 365 dias (sem cache)", carregado(usuario), lambda app: cards.renderizar_card(app.loja.viagens_usuario(usuario), usuario, 365, pd.Timestamp.now())),
+        ("salvar viagem (até gravar)", carregado(usuario), salvar),
+    ]
+
+def bench_app(tamanhos, formato="csv", tipo_backend="local"):
+    nomes_linhas = nomes_linhas_rotas()
+    for n in tamanhos:
+        t0 = time.perf_counter()
+        df, seguindo = gerar_base_sintetica(n, nomes_linhas)
+        t_gerar = time.perf_counter() - t0
+        usuario = df["usuario"].value_counts().index[0]
+        with tempfile.TemporaryDirectory() as pasta:
+            backend = armazenamento.criar_backend(tipo_backend, diretorio=pasta)
+            t0 = time.perf_counter()
+            gravar_base_sintetica(backend, df, seguindo, formato)
+            t_gravar = time.perf_counter() - t0
+            qtd_usuario = int((df["usuario"] == usuario).sum())
+            del df
+            print(f"\n{n} viagens, {len(seguindo)} usuários ({formato}, {tipo_backend}): gerar {t_gerar:.1f}s, gravar {t_gravar:.1f}s; "
+                  f"usuário medido: {usuario} ({qtd_usuario} viagens, segue {len(seguindo[usuario])})")
+            print(f"{'operação':<30} {'tempo (ms)':>11} {'pico (MB)':>10}")
+            for nome, preparar, executar in operacoes_app(lambda: montar_app(backend, nomes_linhas, formato), usuario, nomes_linhas):
+                tempo, pico = medir(preparar, executar)
+                print(f"{nome:<30} {tempo * 1000:>11.2f} {pico / 2**20:>10.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks do BusLog")
+    parser.add_argument("bench", choices=["clusters", "formatos", "app"])
+    parser.add_argument("--tamanhos", type=int, nargs="+")
+    parser.add_argument("--formato", choices=list(viagens_db.FORMATOS), default="csv")
+    parser.add_argument("--backend", choices=["local", "git"], default="local")
+    args = parser.parse_args()
+    if args.bench == "clusters": bench_clusters(args.tamanhos or [10_000, 100_000, 1_000_000])
+    if args.bench == "formatos": bench_formatos(args.tamanhos or [10_000, 100_000, 1_000_000])
+    if args.bench == "app": bench_app(args.tamanhos or [1_000, 10_000, 100_000, 1_000_000], args.formato, args.backend)
+    sys.exit(0)
@@ -0,0 +1,91 @@
+import re
+import heapq
+import bisect
+import itertools
+import unicodedata
+
+# --- BUSCA TEXTUAL ---
+# Índice de prefixo sobre tokens normalizados (minúsculas, sem acento).
+# Cada token da consulta casa com os tokens do índice que começam por ele, e um
+# documento precisa casar todos os tokens da consulta. Se nenhum documento casa por
+# prefixo, cada token (de 3+ caracteres) passa a casar também no meio dos tokens do
+# índice: um str.find sobre os tokens distintos emendados num texto só (montado na
+# primeira vez que isso acontece), parando em LIMITE_TRECHO tokens achados, sem passar
+# pelos documentos. O ranking usa um peso opcional por documento (ex.: linhas mais
+# usadas pelo usuário) e a qualidade do casamento.
+
+LIMITE_TRECHO = 500
+
+def normalizar(texto):
+    texto = unicodedata.normalize("NFKD", str(texto)).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^a-z0-9]+", " ", texto.lower()).strip()
+
+def tokenizar(texto): return normalizar(texto).split()
+
+class IndiceBusca:
+    def __init__(self, documentos):
+        # documentos: pares (id, texto)
+        self.textos = {}
+        self._normalizados = {}
+        docs_do_token = {}
+        for id_doc, texto in documentos:
+            self.textos[id_doc] = texto
+            self._normalizados[id_doc] = normalizar(texto)
+            for token in set(tokenizar(texto)): docs_do_token.setdefault(token, set()).add(id_doc)
+        self._tokens = sorted(docs_do_token)
+        self._docs = [frozenset(docs_do_token[t]) for t in self._tokens]
+        self._emendados = None
+
+    def __len__(self): return len(self.textos)
+
+    def _docs_com_prefixo(self, prefixo):
+        ini = bisect.bisect_left(self._tokens, prefixo)
+        fim = bisect.bisect_left(self._tokens, prefixo + "\uffff")
+        if fim - ini == 1: return self._docs[ini]
+        docs = set()
+        for i in range(ini, fim): docs |= self._docs[i]
+        return docs
+
+    def _texto_emendado(self):
+        # Os tokens separados por "\n" e a posição onde cada um começa
+        if self._emendados is None:
+            inicios = list(itertools.accumulate((len(t) + 1 for t in self._tokens), initial=0))[:-1]
+            self._emendados = ("\n".join(self._tokens), inicios)
+        return self._emendados
+
+    def _docs_com_trecho(self, trecho):
+        # Tokens que contêm o trecho em qualquer posição (no máximo LIMITE_TRECHO deles)
+        if len(trecho) < 3: return self._docs_com_prefixo(trecho)
+        texto, inicios = self._texto_emendado()
+        docs, achados, pos = set(), 0, texto.find(trecho)
+        while pos != -1 and achados < LIMITE_TRECHO:
+            i = bisect.bisect_right(inicios, pos) - 1
+            docs |= self._docs[i]
+            achados += 1
+            pos = texto.find(trecho, inicios[i] + len(self._tokens[i]))
+        return docs
+
+    def _casar(self, tokens, docs_do_token):
+        candidatos = None
+        for token in sorted(tokens, key=len, reverse=True):
+            docs = docs_do_token(token)
+            candidatos = set(docs) if candidatos is None else candidatos & docs
+            if not candidatos: break
+        return candidatos
+
+    def buscar(self, consulta, k=20, pesos=None):
+        pesos = pesos or {}
+        tokens = tokenizar(consulta)
+        if not tokens:
+            # Sem consulta: os documentos com peso (ex.: linhas do próprio usuário) ou, sem pesos, todos
+            candidatos = [d for d in pesos if d in self.textos] or self.textos.keys()
+        else:
+            # Último recurso: trecho no meio dos tokens
+            candidatos = self._casar(tokens, self._docs_com_prefixo) or self._casar(tokens, self._docs_com_trecho)
+        alvo = " ".join(tokens)
+
+        def ordem(d):
+            normalizado = self._normalizados[d]
+            qualidade = 2 if alvo and normalizado.startswith(alvo) else (1 if alvo and alvo in normalizado.split() else 0)
+            return (-pesos.get(d, 0), -qualidade, normalizado)
+        return [(d, self.textos[d]) for d in heapq.nsmallest(k, candidatos, key=ordem)]
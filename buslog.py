@@ -2,15 +2,23 @@ import streamlit as st
 import json
 import pandas as pd
 from datetime import datetime, timedelta, time as datetime_time
-from github import Github
 import io
+import os
 import time
-import bcrypt
 import base64
-import threading
-import matplotlib.pyplot as plt
-import matplotlib.gridspec as gridspec
-import textwrap
+from concurrent.futures import ThreadPoolExecutor
+import armazenamento
+import viagens_db
+import feed
+import linhas
+import busca
+import social_db
+import gamificacao
+import notificacoes_db
+import perfis_db
+import credenciais
+import cards
+import instrumentacao
 
 # --- CONFIGURAÇÃO INICIAL ---
 st.set_page_config(page_title="BusLog", page_icon="🚌", layout="centered")
@@ -116,341 +124,261 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # --- SEGREDOS ---
-try:
-    GITHUB_TOKEN = st.secrets["GITHUB_TOKEN"]
-    REPO_NAME = st.secrets["REPO_NAME"] 
-except FileNotFoundError:
-    st.error("Configure os Secrets no Streamlit Cloud!")
-    st.stop()
-
-ARQUIVO_DB_VIAGENS = "viagens.csv"
+def ler_segredo(chave, padrao=None):
+    try: return st.secrets.get(chave, os.environ.get(chave, padrao))
+    except FileNotFoundError: return os.environ.get(chave, padrao)
+
+# "github" (padrão), "local" (arquivos numa pasta do servidor, sem chamadas de API)
+# ou "git" (repositório git bare local, com commits como no GitHub; para testes offline)
+BACKEND_ARMAZENAMENTO = ler_segredo("BACKEND_ARMAZENAMENTO", "github")
+PASTA_APP = os.path.dirname(os.path.abspath(__file__))
+DIRETORIO_DADOS = ler_segredo("DIRETORIO_DADOS", os.path.join(PASTA_APP, "dados.git") if BACKEND_ARMAZENAMENTO == "git" else PASTA_APP)
+GITHUB_TOKEN, REPO_NAME = None, None
+
+if BACKEND_ARMAZENAMENTO == "github":
+    try:
+        GITHUB_TOKEN = st.secrets["GITHUB_TOKEN"]
+        REPO_NAME = st.secrets["REPO_NAME"] 
+    except FileNotFoundError:
+        st.error("Configure os Secrets no Streamlit Cloud!")
+        st.stop()
+
+ARQUIVO_DB_VIAGENS = "viagens.csv"  # formato antigo, só lido para migrar para os shards
+PASTA_VIAGENS = "viagens"
+# "csv" (padrão), "npz" (colunar, só NumPy) ou "parquet" (colunar, precisa do pyarrow)
+FORMATO_VIAGENS = ler_segredo("FORMATO_VIAGENS", "csv")
 ARQUIVO_DB_USUARIOS = "usuarios.json"
 ARQUIVO_DB_PERFIL = "perfil.json"
 ARQUIVO_DB_SOCIAL = "social.json"
-ARQUIVO_DB_NOTIFICACOES = "notificacoes.json"
+ARQUIVO_DB_NOTIFICACOES = "notificacoes.json"  # formato antigo, só lido para migrar para as caixas
+PASTA_NOTIFICACOES = "notificacoes"
 ARQUIVO_ROTAS = "rotasrj.json"
 
 # --- ESTADO DE SESSÃO & CACHE LOCAL ---
 if "form_key" not in st.session_state: st.session_state["form_key"] = 0
-if "limite_registros" not in st.session_state: st.session_state["limite_registros"] = 10
+if "cursores_diario" not in st.session_state: st.session_state["cursores_diario"] = [None]
 if "perfil_visitado" not in st.session_state: st.session_state["perfil_visitado"] = None
 if "ver_lista_seguidores" not in st.session_state: st.session_state["ver_lista_seguidores"] = None
+if "paginas_feed" not in st.session_state: st.session_state["paginas_feed"] = 1
+
+# --- INSTRUMENTAÇÃO ---
+# Tempos por trecho num agregado do processo. O painel "🛠️ Desempenho" da barra lateral só
+# aparece para os usuários em ADMINS (separados por vírgula, nenhum por padrão); LOG_METRICAS=1 grava uma linha
+# JSON por rerun no log do servidor.
+ADMINS = {u.strip() for u in str(ler_segredo("ADMINS", "")).split(",") if u.strip()}
+LOG_METRICAS = str(ler_segredo("LOG_METRICAS", "0")) == "1"
+
+@st.cache_resource
+def get_instrumentacao():
+    if LOG_METRICAS: instrumentacao.ativar_log()
+    return instrumentacao.Instrumentacao()
 
-if "cache_viagens" not in st.session_state: st.session_state["cache_viagens"] = pd.DataFrame()
-if "dados_carregados" not in st.session_state: st.session_state["dados_carregados"] = False
+metricas = get_instrumentacao()
+metricas.iniciar_rerun()
+metricas.etapa("inicializacao")
 
 # --- FUNÇÕES BÁSICAS ---
 def agora_br(): return datetime.utcnow() - timedelta(hours=3)
-def get_repo(): return Github(GITHUB_TOKEN).get_repo(REPO_NAME)
+
+@st.cache_resource
+def get_backend():
+    # Escritas passam por uma fila por arquivo: várias mudanças seguidas viram um commit só
+    destino = armazenamento.criar_backend(BACKEND_ARMAZENAMENTO, token=GITHUB_TOKEN, nome_repo=REPO_NAME, diretorio=DIRETORIO_DADOS)
+    return armazenamento.FilaEscrita(destino, intervalo_flush=float(ler_segredo("INTERVALO_FLUSH", 2.0)))
+
+backend = get_backend()
+
+# Leituras de um rerun: o Carregador é novo a cada execução do script e não repete chaves;
+# o pool é do processo (LEITURAS_PARALELAS threads)
+@st.cache_resource
+def get_pool_leituras(): return ThreadPoolExecutor(max_workers=int(ler_segredo("LEITURAS_PARALELAS", 8)), thread_name_prefix="leituras")
+
+carregador = armazenamento.Carregador(get_pool_leituras())
+
+# Último conteúdo lido de cada arquivo e o objeto decodificado. Se os bytes não mudaram
+# (no GitHub, revalidação com 304) o mesmo objeto é devolvido sem decodificar de novo:
+# quem chama trata o resultado como somente leitura.
+@st.cache_resource
+def get_cache_decodificado(): return {}
+
+cache_decodificado = get_cache_decodificado()
 
 def ler_arquivo_github(nome_arquivo, tipo='json'):
     try:
-        repo = get_repo()
-        contents = repo.get_contents(nome_arquivo)
-        decodificado = contents.decoded_content.decode("utf-8")
-        if tipo == 'json': return json.loads(decodificado)
-        else: return pd.read_csv(io.StringIO(decodificado))
+        conteudo = backend.ler(nome_arquivo)
+        anterior = cache_decodificado.get((nome_arquivo, tipo))
+        if anterior is not None and anterior[0] == conteudo: return anterior[1]
+        decodificado = conteudo.decode("utf-8")
+        if tipo == 'json': objeto = json.loads(decodificado)
+        else: objeto = pd.read_csv(io.StringIO(decodificado))
+        cache_decodificado[(nome_arquivo, tipo)] = (conteudo, objeto)
+        return objeto
     except: return {} if tipo == 'json' else pd.DataFrame()
 
-def atualizar_arquivo_github(nome_arquivo, conteudo, mensagem_commit):
-    repo = get_repo()
+def alteracao_json(nome_arquivo, alterar):
+    # alterar(dados) muda o dict no lugar e devolve False se não houve mudança.
+    # Roda na fila, sobre o conteúdo mais recente: em conflito é reaplicado sobre o arquivo relido.
+    def transformar(atual):
+        dados = json.loads(atual.decode("utf-8")) if atual else {}
+        if alterar(dados) is False: return atual or b"{}"
+        return json.dumps(dados, indent=4)
+    return (nome_arquivo, "transformar", transformar)
+
+@st.cache_data(ttl=3600) 
+def carregar_rotas():
+    dados_nuvem = ler_arquivo_github(ARQUIVO_ROTAS, 'json')
+    if dados_nuvem: return dados_nuvem
     try:
-        contents = repo.get_contents(nome_arquivo)
-        repo.update_file(contents.path, mensagem_commit, conteudo, contents.sha)
-    except:
-        repo.create_file(nome_arquivo, mensagem_commit, conteudo)
+        with open(ARQUIVO_ROTAS, "r", encoding="utf-8") as f: return json.load(f)
+    except: return {}
 
-def salvar_background(df_para_salvar):
-    csv_str = df_para_salvar.to_csv(index=False)
-    atualizar_arquivo_github(ARQUIVO_DB_VIAGENS, csv_str, "Update Background")
+rotas_db = carregar_rotas()
+lista_linhas = list(rotas_db.keys()) if rotas_db else []
+total_linhas_sistema = len(lista_linhas) if lista_linhas else 1
 
-def hash_senha(password): return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
-def verificar_senha(password, hashed): return bcrypt.checkpw(password.encode(), hashed.encode())
+# Ids inteiros e flags de modal de cada linha, calculados uma vez por processo
+@st.cache_resource
+def get_catalogo_linhas(): return linhas.CatalogoLinhas(lista_linhas)
 
-def sincronizar_dados():
-    df = ler_arquivo_github(ARQUIVO_DB_VIAGENS, 'csv')
-    st.session_state["cache_viagens"] = df
-    st.session_state["dados_carregados"] = True
+catalogo_linhas = get_catalogo_linhas()
+
+@st.cache_resource
+def get_indice_linhas(): return busca.IndiceBusca((catalogo_linhas.ids[n], n) for n in lista_linhas)
+
+indice_linhas = get_indice_linhas()
 
-if not st.session_state["dados_carregados"]: sincronizar_dados()
+@metricas.medir()
+def sugerir_linhas(usuario, consulta, k=30):
+    recentes = loja_viagens.viagens_usuario(usuario)['linha_id'].head(linhas.BONUS_RECENTES).tolist()
+    pesos = linhas.pesos_usuario(loja_viagens.estatisticas(usuario).linhas, recentes)
+    return [nome for _, nome in indice_linhas.buscar(consulta, k, pesos)]
+
+# Viagens ficam num cache único do processo, compartilhado por todas as sessões,
+# gravadas em shards por usuário e mês (viagens/<usuario>/<AAAA-MM>.csv)
+@st.cache_resource
+def get_loja_viagens():
+    armazem = viagens_db.ShardsViagens(backend, PASTA_VIAGENS, legado=viagens_db.LogViagens(backend, ARQUIVO_DB_VIAGENS), formato=FORMATO_VIAGENS)
+    return viagens_db.LojaViagens(armazem, catalogo_linhas)
+
+loja_viagens = get_loja_viagens()
+armazem_viagens = loja_viagens.armazem
+
+@st.cache_resource
+def get_motor_feed(): return feed.MotorFeed(loja_viagens)
+
+motor_feed = get_motor_feed()
+
+@metricas.medir()
+def salvar_background(registro=None, removido=None):
+    # Reescreve só o shard do mês da viagem (e o manifesto), pela fila de escrita
+    if registro is not None: armazem_viagens.anexar(registro)
+    if removido is not None: armazem_viagens.remover(removido)
+
+@metricas.medir()
+def sincronizar_dados():
+    try: loja_viagens.recarregar()
+    except: pass
 
 # --- NOTIFICAÇÕES ---
-def carregar_notificacoes():
-    return ler_arquivo_github(ARQUIVO_DB_NOTIFICACOES, 'json')
+# Uma caixa por usuário (notificacoes/<usuario>.json) num cache único do processo, com o
+# contador de não lidas mantido na memória: o rerun não baixa as notificações de ninguém
+@st.cache_resource
+def get_caixas_notificacoes(): return notificacoes_db.CaixasNotificacoes(backend, PASTA_NOTIFICACOES, legado=ARQUIVO_DB_NOTIFICACOES)
 
-def salvar_notificacoes(dados):
-    json_str = json.dumps(dados, indent=4)
-    atualizar_arquivo_github(ARQUIVO_DB_NOTIFICACOES, json_str, "Notif update")
+caixas_notificacoes = get_caixas_notificacoes()
 
-def adicionar_notificacao(target_user, from_user, tipo="follow"):
-    if target_user == from_user: return
-    
-    dados = carregar_notificacoes()
-    if target_user not in dados: dados[target_user] = []
-    
-    existe = False
-    for n in dados[target_user]:
-        if n['from_user'] == from_user and n['type'] == tipo and not n.get('read', False):
-            existe = True
-            break
-            
-    if not existe:
-        dados[target_user].insert(0, {
-            "from_user": from_user,
-            "type": tipo,
-            "timestamp": str(agora_br()),
-            "read": False
-        })
-        salvar_notificacoes(dados)
+def alteracao_notificacao(target_user, from_user, tipo="follow"):
+    # None quando já existe uma igual não lida
+    return caixas_notificacoes.alteracao_nova(target_user, from_user, tipo, str(agora_br()))
 
 def marcar_todas_lidas(usuario):
-    dados = carregar_notificacoes()
-    if usuario in dados:
-        changed = False
-        for n in dados[usuario]:
-            if not n.get('read', False):
-                n['read'] = True
-                changed = True
-        if changed: salvar_notificacoes(dados)
+    alteracao = caixas_notificacoes.alteracao_lidas(usuario)
+    if alteracao: backend.transacao([alteracao], "Notif update")
 
 # --- SOCIAL & PERFIL ---
-def carregar_social(): return ler_arquivo_github(ARQUIVO_DB_SOCIAL, 'json')
-def salvar_social(dados):
-    json_str = json.dumps(dados, indent=4)
-    atualizar_arquivo_github(ARQUIVO_DB_SOCIAL, json_str, "Social update")
+@st.cache_resource
+def get_grafo_social(): return social_db.GrafoSocial(armazenamento.LogJson(backend, ARQUIVO_DB_SOCIAL))
+
+grafo_social = get_grafo_social()
 
 def seguir_usuario(eu, outro):
-    dados = carregar_social()
-    if eu not in dados: dados[eu] = []
-    if outro not in dados[eu]:
-        dados[eu].append(outro)
-        salvar_social(dados)
-        t = threading.Thread(target=adicionar_notificacao, args=(outro, eu, "follow"))
-        t.start()
-        return True
-    return False
+    # O follow e a notificação vão no mesmo commit
+    notificacao = alteracao_notificacao(outro, eu, "follow") if outro != eu and not grafo_social.segue(eu, outro) else None
+    return grafo_social.seguir(eu, outro, junto=[notificacao] if notificacao else [])
 
-def deixar_seguir(eu, outro):
-    dados = carregar_social()
-    if eu in dados and outro in dados[eu]:
-        dados[eu].remove(outro)
-        salvar_social(dados)
-        return True
-    return False
+def deixar_seguir(eu, outro): return grafo_social.deixar_seguir(eu, outro)
+
+@metricas.medir()
+def get_seguidores_count(usuario): return grafo_social.qtd_seguidores(usuario), grafo_social.qtd_seguindo(usuario)
+
+# Perfis num cache único do processo, com índice para a busca de usuários
+@st.cache_resource
+def get_diretorio_perfis(): return perfis_db.DiretorioPerfis(backend, ARQUIVO_DB_PERFIL)
 
-def get_seguidores_count(usuario):
-    dados = carregar_social()
-    seguidores = [u for u, lista in dados.items() if usuario in lista]
-    seguindo = dados.get(usuario, [])
-    return seguidores, seguindo
+diretorio_perfis = get_diretorio_perfis()
 
 def carregar_perfil(usuario):
-    db_perfil = ler_arquivo_github(ARQUIVO_DB_PERFIL, 'json')
-    if usuario in db_perfil: return db_perfil[usuario]
+    perfil = diretorio_perfis.perfil(usuario)
+    if perfil is not None: return perfil
     else: return { "display_name": usuario.capitalize(), "bio": "Busólogo.", "avatar": "👤" }
 
+def alteracao_perfil(usuario, display_name, bio, avatar):
+    # O diretório em memória já recebe o perfil novo; o arquivo é atualizado pela fila
+    perfil = { "display_name": display_name, "bio": bio, "avatar": avatar, "updated_at": str(agora_br()) }
+    diretorio_perfis.atualizar(usuario, perfil)
+    return alteracao_json(ARQUIVO_DB_PERFIL, lambda db_perfil: db_perfil.__setitem__(usuario, perfil))
+
 def salvar_perfil_editado(usuario, display_name, bio, avatar):
-    db_perfil = ler_arquivo_github(ARQUIVO_DB_PERFIL, 'json')
-    db_perfil[usuario] = { "display_name": display_name, "bio": bio, "avatar": avatar, "updated_at": str(agora_br()) }
-    json_str = json.dumps(db_perfil, indent=4)
-    atualizar_arquivo_github(ARQUIVO_DB_PERFIL, json_str, f"Perfil atualizado: {usuario}")
+    backend.transacao([alteracao_perfil(usuario, display_name, bio, avatar)], f"Perfil atualizado: {usuario}")
     return True
 
-# --- LÓGICA DE GAMIFICAÇÃO (NOVA) ---
-def calcular_gamificacao(df_user, total_linhas_sistema):
-    if df_user.empty:
-        return {
-            "nivel": 1, "xp_total": 0, "xp_prox": 100, "progresso_nivel": 0,
-            "linhas_unicas": 0, "total_linhas": total_linhas_sistema, "badges": []
-        }
-    
-    # 1. CÁLCULO DE XP
-    total_viagens = len(df_user)
-    linhas_unicas_user = df_user['linha'].unique()
-    qtd_linhas_unicas = len(linhas_unicas_user)
-    
-    # XP Base: 10 por viagem, 20 por linha única
-    xp = (total_viagens * 10) + (qtd_linhas_unicas * 20)
-    nivel = int(xp / 100) + 1
-    xp_prox_nivel = nivel * 100
-    progresso_nivel = (xp % 100) / 100 # Porcentagem 0.0 a 1.0
-
-    # 2. CÁLCULO DE BADGES
-    badges = []
-    
-    # Badge: Veterano (50+ viagens)
-    if total_viagens >= 50: badges.append("🚌 Veterano")
-    
-    # Badge: Explorador (10+ linhas diferentes)
-    if qtd_linhas_unicas >= 10: badges.append("🌍 Explorador")
-    
-    # Badge: Corujão (Viagens 00h-05h)
-    # Garante datetime
-    if 'dt' not in df_user.columns:
-        df_user['dt'] = pd.to_datetime(df_user['data'].astype(str) + ' ' + df_user['hora'].astype(str), errors='coerce')
-    madrugada = df_user[df_user['dt'].dt.hour.isin([0, 1, 2, 3, 4])]
-    if not madrugada.empty: badges.append("🦉 Corujão")
-    
-    # Badge: Ferroviário (Trem/Metrô/VLT)
-    ferroviario = df_user[df_user['linha'].str.contains("Trem|Ramal|Metrô|VLT", case=False, na=False)]
-    if len(ferroviario) >= 1: badges.append("🚆 Ferroviário")
-    
-    # Badge: Expresso (BRT)
-    brt = df_user[df_user['linha'].str.contains("BRT", case=False, na=False)]
-    if len(brt) >= 1: badges.append("🚄 Expresso")
-    
-    # Badge: Marujo (Barcas)
-    barca = df_user[df_user['linha'].str.contains("Barca", case=False, na=False)]
-    if len(barca) >= 1: badges.append("⚓ Marujo")
-
-    return {
-        "nivel": nivel,
-        "xp_total": xp,
-        "xp_prox": xp_prox_nivel,
-        "progresso_nivel": progresso_nivel,
-        "linhas_unicas": qtd_linhas_unicas,
-        "total_linhas": total_linhas_sistema,
-        "badges": badges
-    }
-
-# --- GERADOR DE CARD ESTATÍSTICO ---
-def gerar_card_stats(df_user, nome_exibicao, dias):
-    agora = agora_br()
-    data_limite = agora - timedelta(days=dias)
-    if 'dt' not in df_user.columns:
-        df_user['dt'] = pd.to_datetime(df_user['data'].astype(str) + ' ' + df_user['hora'].astype(str), errors='coerce')
-    df_filtrado = df_user[df_user['dt'] >= data_limite]
-    if df_filtrado.empty: return None
-
-    total_viagens = len(df_filtrado)
-    contagem_linhas = df_filtrado['linha'].value_counts().head(5)
-    
-    dias_pt = {0: 'Seg', 1: 'Ter', 2: 'Qua', 3: 'Qui', 4: 'Sex', 5: 'Sáb', 6: 'Dom'}
-    df_filtrado['dia_semana'] = df_filtrado['dt'].dt.weekday.map(dias_pt)
-    contagem_dias = df_filtrado['dia_semana'].value_counts().sort_values(ascending=True)
-
-    plt.style.use('dark_background')
-    fig = plt.figure(figsize=(8, 8))
-    
-    bg_color = '#1c1c1e'
-    text_color = '#ffffff'
-    sub_text_color = '#aaaaaa'
-    orange_color = '#ff7f0e'
-
-    fig.patch.set_facecolor(bg_color)
-    fig.patch.set_linewidth(4)
-    fig.patch.set_edgecolor('#333333')
-
-    gs = gridspec.GridSpec(1, 2, width_ratios=[1.3, 0.7])
-    ax_left = plt.subplot(gs[0])
-    ax_right = plt.subplot(gs[1])
-    
-    ax_left.set_facecolor(bg_color)
-    ax_right.set_facecolor(bg_color)
-    ax_left.axis('off')
-    ax_right.axis('off')
-
-    left_anchor = 0.05
-    ax_left.text(left_anchor, 0.94, "buslog.streamlit.app", ha='left', va='center', fontsize=20, color=text_color, weight='bold', transform=ax_left.transAxes)
-    ax_left.text(left_anchor, 0.89, f"@{nome_exibicao} • Últimos {dias} dias", ha='left', va='center', fontsize=12, color=sub_text_color, transform=ax_left.transAxes)
-    ax_left.plot([left_anchor, 0.9], [0.85, 0.85], color='#444', transform=ax_left.transAxes, linewidth=1)
-
-    ax_left.text(left_anchor, 0.72, f"{total_viagens}", ha='left', va='bottom', fontsize=70, color=text_color, weight='bold', transform=ax_left.transAxes)
-    ax_left.text(left_anchor, 0.68, "VIAGENS NO PERÍODO", ha='left', va='top', fontsize=12, color=sub_text_color, transform=ax_left.transAxes)
-
-    ax_left.text(left_anchor, 0.55, "TOP LINHAS", ha='left', va='center', fontsize=14, color=text_color, weight='bold', transform=ax_left.transAxes)
-    
-    y_pos = 0.48
-    for i, (linha, count) in enumerate(contagem_linhas.items()):
-        wrapped_name = textwrap.fill(linha, width=28)
-        ax_left.text(left_anchor, y_pos, wrapped_name, ha='left', va='top', fontsize=11, color=text_color, transform=ax_left.transAxes, linespacing=1.2)
-        ax_left.text(0.9, y_pos, f"{count}x", ha='right', va='top', fontsize=11, color=sub_text_color, weight='bold', transform=ax_left.transAxes)
-        num_lines = len(wrapped_name.split('\n'))
-        y_pos -= (0.04 * num_lines) + 0.03
-
-    ax_right.text(0.5, 0.55, "POR DIA DA SEMANA", ha='center', va='center', fontsize=12, color=text_color, weight='bold', transform=ax_right.transAxes)
-
-    inset_ax = ax_right.inset_axes([0.1, 0.05, 0.8, 0.45])
-    inset_ax.set_facecolor(bg_color)
-
-    if not contagem_dias.empty:
-        dias_labels = contagem_dias.index.tolist()
-        valores_dias = contagem_dias.values.tolist()
-        y_positions = range(len(dias_labels))
-        
-        bars_dias = inset_ax.barh(y_positions, valores_dias, color=orange_color)
-        inset_ax.set_yticks(y_positions)
-        inset_ax.set_yticklabels(dias_labels)
-        
-        for spine in inset_ax.spines.values(): spine.set_visible(False)
-        inset_ax.set_xticks([])
-        inset_ax.tick_params(axis='y', colors=text_color, labelsize=11, length=0)
-
-        for bar in bars_dias:
-            width = bar.get_width()
-            inset_ax.text(width + 0.1, bar.get_y() + bar.get_height()/2, f'{int(width)}', va='center', color=text_color, fontsize=10, weight='bold')
-    else:
-        inset_ax.text(0.5, 0.5, "Sem dados", ha='center', va='center', color=sub_text_color)
-        inset_ax.axis('off')
-
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=150, facecolor=fig.get_facecolor(), edgecolor=fig.get_edgecolor())
-    buf.seek(0)
-    plt.close(fig)
-    return buf
-
-# --- LÓGICA FEED ---
-def agrupar_viagens_atividade(df_viagens):
-    if df_viagens.empty: return []
-    df_viagens['datetime_full'] = pd.to_datetime(df_viagens['data'].astype(str) + ' ' + df_viagens['hora'].astype(str), errors='coerce')
-    df_viagens = df_viagens.dropna(subset=['datetime_full'])
-    df_viagens = df_viagens.sort_values(by=['usuario', 'datetime_full'], ascending=[True, False])
-    
-    feed_items = []
-    for usuario, grupo_user in df_viagens.groupby('usuario'):
-        grupo_user = grupo_user.sort_values('datetime_full', ascending=True)
-        viagens_user = grupo_user.to_dict('records')
-        if not viagens_user: continue
-        clusters = []; cluster_atual = [viagens_user[0]]
-        for i in range(1, len(viagens_user)):
-            viagem = viagens_user[i]
-            ultima = cluster_atual[-1]
-            if (viagem['datetime_full'] - ultima['datetime_full']) <= timedelta(hours=2): cluster_atual.append(viagem)
-            else: clusters.append(cluster_atual); cluster_atual = [viagem]
-        clusters.append(cluster_atual)
-        for cluster in clusters: feed_items.append({ "usuario": usuario, "datetime_ref": cluster[-1]['datetime_full'], "viagens": cluster[::-1] })
-    feed_items.sort(key=lambda x: x['datetime_ref'], reverse=True)
-    return feed_items
-
 # --- AUTH & UTIL ---
+# Contas num cache único do processo; o bcrypt roda num pool com custo configurável
+# (BCRYPT_RODADAS) e hashes antigos são refeitos no login
+@st.cache_resource
+def get_credenciais():
+    log = armazenamento.LogJson(backend, ARQUIVO_DB_USUARIOS)
+    return credenciais.Credenciais(log, int(ler_segredo("BCRYPT_RODADAS", 12)), int(ler_segredo("BCRYPT_TRABALHADORES", 2)))
+
+contas = get_credenciais()
+
+# Primeira execução do processo: viagens (lista de usuários), social, perfis e contas são lidos juntos
+if not loja_viagens.carregada: carregador.antecipar("viagens", loja_viagens.recarregar)
+for nome, store in (("social", grafo_social), ("perfis", diretorio_perfis), ("contas", contas)):
+    if not store.carregado: carregador.antecipar(nome, store.recarregar)
+carregador.esperar()
+
+# Cards do relatório: cache por (usuário, período, versão dos dados, dia). Com PRE_RENDERIZAR_CARDS=1,
+# os usuários com viagens mais recentes (quantos couberem no cache) são desenhados em segundo plano
+@st.cache_resource
+def get_cache_cards():
+    cache = cards.CacheCards(loja_viagens)
+    if str(ler_segredo("PRE_RENDERIZAR_CARDS", "0")) == "1":
+        cache.iniciar_pre_renderizacao(loja_viagens.usuarios_recentes(cache.capacidade // len(cards.PERIODOS)), agora_br)
+    return cache
+
+cache_cards = get_cache_cards()
+
+@metricas.medir()
 def registrar_usuario(usuario, senha):
     usuario = usuario.lower().strip()
-    db_usuarios = ler_arquivo_github(ARQUIVO_DB_USUARIOS, 'json')
-    if usuario in db_usuarios: return False, "Usuário já existe!"
-    db_usuarios[usuario] = { "password": hash_senha(senha), "created_at": str(agora_br()) }
-    json_str = json.dumps(db_usuarios, indent=4)
-    atualizar_arquivo_github(ARQUIVO_DB_USUARIOS, json_str, f"Novo usuario: {usuario}")
-    salvar_perfil_editado(usuario, usuario.capitalize(), "Busólogo iniciante.", "👤")
+    if contas.existe(usuario): return False, "Usuário já existe!"
+    # Conta e perfil num commit só: nunca existe usuário sem perfil no repositório
+    perfil = alteracao_perfil(usuario, usuario.capitalize(), "Busólogo iniciante.", "👤")
+    if not contas.criar(usuario, senha, str(agora_br()), junto=[perfil]): return False, "Usuário já existe!"
     return True, "Conta criada!"
 
+@metricas.medir()
 def fazer_login(usuario, senha):
-    usuario = usuario.lower().strip()
-    db_usuarios = ler_arquivo_github(ARQUIVO_DB_USUARIOS, 'json')
-    if usuario in db_usuarios:
-        if verificar_senha(senha, db_usuarios[usuario]['password']): return True
-    return False
-
-def excluir_registro_rapido(index_original):
-    df = st.session_state["cache_viagens"]
-    if index_original in df.index:
-        df = df.drop(index_original)
-        if not df.empty:
-            df['datetime_temp'] = pd.to_datetime(df['data'].astype(str) + ' ' + df['hora'].astype(str), errors='coerce')
-            df = df.sort_values(by=['usuario', 'datetime_temp'], ascending=[True, False])
-            df = df.drop(columns=['datetime_temp'])
-        st.session_state["cache_viagens"] = df
-        t = threading.Thread(target=salvar_background, args=(df.copy(),))
-        t.start()
+    ok, espera = contas.verificar(usuario.lower().strip(), senha)
+    if ok: return True, ""
+    if espera: return False, f"Muitas tentativas. Tente de novo em {int(espera) + 1}s."
+    return False, "Erro."
+
+def excluir_registro_rapido(usuario, id_viagem):
+    removido = loja_viagens.remover(usuario, id_viagem)
+    if removido is not None:
+        salvar_background(removido=removido)
         return True
     return False
 
@@ -463,18 +391,15 @@ def tocar_buzina():
             st.markdown(f"""<audio autoplay><source src="data:audio/mp4;base64,{b64}" type="audio/mp4"></audio>""", unsafe_allow_html=True)
     except FileNotFoundError: pass 
 
-@st.cache_data(ttl=3600) 
-def carregar_rotas():
-    dados_nuvem = ler_arquivo_github(ARQUIVO_ROTAS, 'json')
-    if dados_nuvem: return dados_nuvem
-    try:
-        with open(ARQUIVO_ROTAS, "r", encoding="utf-8") as f: return json.load(f)
-    except: return {}
-
-rotas_db = carregar_rotas()
-lista_linhas = list(rotas_db.keys()) if rotas_db else []
-total_linhas_sistema = len(lista_linhas) if lista_linhas else 1
 MESES_PT = {1: "JANEIRO", 2: "FEVEREIRO", 3: "MARÇO", 4: "ABRIL", 5: "MAIO", 6: "JUNHO", 7: "JULHO", 8: "AGOSTO", 9: "SETEMBRO", 10: "OUTUBRO", 11: "NOVEMBRO", 12: "DEZEMBRO"}
+TAMANHO_PAGINA_DIARIO = 10
+
+def janela_diario(filtro, agora):
+    # Filtro do diário -> (desde, ate) inclusivos, aplicados no índice da loja
+    if filtro == "7 Dias": return agora - timedelta(days=7), None
+    if filtro == "30 Dias": return agora - timedelta(days=30), None
+    if filtro == "Este Ano": return datetime(agora.year, 1, 1), datetime(agora.year + 1, 1, 1) - timedelta(microseconds=1)
+    return None, None
 
 # --- INTERFACE ---
 
@@ -482,8 +407,22 @@ if "logado" not in st.session_state:
     st.session_state["logado"] = False
     st.session_state["usuario_atual"] = ""
 
+painel_desempenho = None
+
 if st.session_state["logado"]:
     meu_user = st.session_state["usuario_atual"]
+    metricas.etapa("topo")
+
+    # O que a página vai mostrar começa a baixar já, em paralelo: as viagens do perfil
+    # visitado ou, na tela principal, a minha caixa, as minhas viagens e só o mês mais novo
+    # de quem eu sigo (o feed lê mês a mês: o histórico inteiro deles não é baixado).
+    # Quem pedir o mesmo dado depois espera a carga em andamento em vez de baixar de novo.
+    if st.session_state["perfil_visitado"]:
+        carregador.antecipar(("viagens", st.session_state["perfil_visitado"]), loja_viagens.viagens_usuario, st.session_state["perfil_visitado"])
+    else:
+        carregador.antecipar(("notificacoes", meu_user), caixas_notificacoes.caixa, meu_user)
+        carregador.antecipar(("viagens", meu_user), loja_viagens.viagens_usuario, meu_user)
+        for u in grafo_social.seguindo(meu_user): carregador.antecipar(("viagens_mes", u), loja_viagens.viagens_mes_recente, u)
     
     col_titulo, col_pesquisa = st.columns([0.65, 0.35])
     with col_titulo: st.title("🚌 BusLog")
@@ -492,13 +431,12 @@ if st.session_state["logado"]:
         termo_busca = st.text_input("🔍 Buscar Busólogo", placeholder="Nome ou user...", label_visibility="collapsed").lower().strip()
     
     if termo_busca:
-        db_perfis = ler_arquivo_github(ARQUIVO_DB_PERFIL, 'json')
-        resultados = [u for u in db_perfis.keys() if termo_busca in u or termo_busca in db_perfis[u].get('display_name', '').lower()]
+        with metricas.cronometro("busca_perfis"): resultados = diretorio_perfis.buscar(termo_busca)
         if resultados:
             st.caption(f"Resultados para '{termo_busca}':")
             cols_res = st.columns(min(len(resultados), 4))
             for i, res in enumerate(resultados):
-                label_res = f"{db_perfis[res].get('display_name', res)} (@{res})"
+                label_res = f"{carregar_perfil(res).get('display_name', res)} (@{res})"
                 if st.button(f"👤 {label_res}", key=f"top_search_{res}", use_container_width=True):
                     st.session_state["perfil_visitado"] = res
                     st.rerun()
@@ -508,27 +446,28 @@ if st.session_state["logado"]:
     with st.sidebar:
         st.write(f"Olá, **busólogo**!")
         st.caption(f"Logado como: @{meu_user}")
+        # Escritas que o armazenamento está recusando continuam na fila e são tentadas de novo
+        if backend.falhas(): st.warning("⚠️ Algumas alterações ainda não foram salvas; tentando de novo.")
         if st.button("🔄 Sincronizar", use_container_width=True):
-            with st.spinner("..."): sincronizar_dados(); st.cache_data.clear()
+            with st.spinner("..."): sincronizar_dados(); grafo_social.recarregar(); diretorio_perfis.recarregar(); st.cache_data.clear()
             st.success("Ok!"); time.sleep(0.5); st.rerun()
         if st.button("🏠 Início", use_container_width=True):
             st.session_state["perfil_visitado"] = None; st.session_state["ver_lista_seguidores"] = None; st.rerun()
         if st.button("🚪 Sair", use_container_width=True): st.session_state["logado"] = False; st.rerun()
+        # Preenchido no fim do rerun, quando os tempos da página já foram medidos
+        if meu_user in ADMINS: painel_desempenho = st.container()
 
     # --- MODO VISITANTE ---
     if st.session_state["perfil_visitado"]:
+        metricas.etapa("visitante")
         visitado = st.session_state["perfil_visitado"]
         dados_perfil = carregar_perfil(visitado)
-        social_db = carregar_social()
-        
-        lista_seguidores, lista_seguindo = get_seguidores_count(visitado)
-        segue_voce = meu_user in lista_seguindo
-        eh_seguido = visitado in social_db.get(meu_user, [])
+        qtd_seguidores, qtd_seguindo = get_seguidores_count(visitado)
+        segue_voce = grafo_social.segue(visitado, meu_user)
+        eh_seguido = grafo_social.segue(meu_user, visitado)
         
         # Gamificação Visitante
-        df_viagens = st.session_state["cache_viagens"]
-        df_visitado = df_viagens[df_viagens['usuario'] == visitado] if not df_viagens.empty else pd.DataFrame()
-        stats = calcular_gamificacao(df_visitado, total_linhas_sistema)
+        with metricas.cronometro("calcular_gamificacao"): stats = gamificacao.calcular_gamificacao(loja_viagens.estatisticas(visitado), total_linhas_sistema)
 
         # Header (Nome e Badge)
         st.markdown(f"""
@@ -554,7 +493,7 @@ if st.session_state["logado"]:
         with c_v1:
             if st.session_state["ver_lista_seguidores"]:
                 tipo_lista = st.session_state["ver_lista_seguidores"]
-                lista_exibir = lista_seguidores if tipo_lista == 'seguidores' else lista_seguindo
+                lista_exibir = grafo_social.seguidores(visitado) if tipo_lista == 'seguidores' else grafo_social.seguindo(visitado)
                 st.write(f"**{tipo_lista.capitalize()}:**")
                 for u in lista_exibir:
                     if st.button(f"@{u}", key=f"lista_{u}"):
@@ -564,8 +503,8 @@ if st.session_state["logado"]:
                 if st.button("Fechar Lista"): st.session_state["ver_lista_seguidores"] = None; st.rerun()
             else:
                 c_s1, c_s2 = st.columns(2)
-                if c_s1.button(f"Seguidores: {len(lista_seguidores)}"): st.session_state["ver_lista_seguidores"] = "seguidores"; st.rerun()
-                if c_s2.button(f"Seguindo: {len(lista_seguindo)}"): st.session_state["ver_lista_seguidores"] = "seguindo"; st.rerun()
+                if c_s1.button(f"Seguidores: {qtd_seguidores}"): st.session_state["ver_lista_seguidores"] = "seguidores"; st.rerun()
+                if c_s2.button(f"Seguindo: {qtd_seguindo}"): st.session_state["ver_lista_seguidores"] = "seguindo"; st.rerun()
 
         with c_v2:
             if visitado != meu_user:
@@ -580,44 +519,41 @@ if st.session_state["logado"]:
                     st.session_state["perfil_visitado"] = None; st.rerun()
 
         st.write(""); st.markdown("### 📓 Diário Público")
-        if not df_viagens.empty:
-            dv = df_viagens[df_viagens['usuario'] == visitado]
-            if not dv.empty:
-                dv['datetime_full'] = pd.to_datetime(dv['data'].astype(str)+' '+dv['hora'].astype(str), errors='coerce')
-                dv = dv.sort_values(by='datetime_full', ascending=False).head(10)
-                for _, row in dv.iterrows():
-                    obs = f" • {row['obs']}" if pd.notna(row['obs']) and row['obs'] else ""
-                    st.markdown(f"""<div class="journal-card"><div class="strip"></div><div class="date-col">{row['datetime_full'].day}</div><div class="info-col"><div class="bus-line">{row['linha']}</div><div class="meta-info">🕒 {str(row['hora'])[:5]}{obs}</div></div></div>""", unsafe_allow_html=True)
-            else: st.info("Sem registros.")
+        with metricas.cronometro("diario.pagina"): dv, _ = loja_viagens.pagina_diario(visitado, TAMANHO_PAGINA_DIARIO)
+        if not dv.empty:
+            for _, row in dv.iterrows():
+                obs = f" • {row['obs']}" if pd.notna(row['obs']) and row['obs'] else ""
+                st.markdown(f"""<div class="journal-card"><div class="strip"></div><div class="date-col">{row['dt'].day}</div><div class="info-col"><div class="bus-line">{row['linha']}</div><div class="meta-info">🕒 {str(row['hora'])[:5]}{obs}</div></div></div>""", unsafe_allow_html=True)
         else: st.info("Sem registros.")
 
     # --- MODO PRINCIPAL ---
     else:
-        db_notif = carregar_notificacoes()
-        minhas_notifs = db_notif.get(meu_user, [])
-        nao_lidas = sum(1 for n in minhas_notifs if not n['read'])
+        nao_lidas = carregador.obter(("notificacoes", meu_user), caixas_notificacoes.caixa, meu_user).nao_lidas
         label_notif = f"🔔 Notificações ({nao_lidas})" if nao_lidas > 0 else "🔔 Notificações"
         
         # --- NOVA ABA DE RELATÓRIOS ---
         aba_feed, aba_nova, aba_diario, aba_notif, aba_reports, aba_perfil = st.tabs(["📡 Atividade", "📝 Nova Viagem", "📓 Diário", label_notif, "📊 Relatórios", "👤 Meu Perfil"])
         
         with aba_feed:
-            df_viagens = st.session_state["cache_viagens"]
-            if not df_viagens.empty:
-                social_db = carregar_social()
-                quem_sigo = social_db.get(meu_user, [])
+            metricas.etapa("aba_feed")
+            if loja_viagens.usuarios():
+                quem_sigo = grafo_social.seguindo(meu_user)
                 if not quem_sigo: st.info("Siga amigos para ver atividades!")
                 else:
-                    df_feed = df_viagens[df_viagens['usuario'].isin(quem_sigo)].copy()
-                    feed_items = agrupar_viagens_atividade(df_feed)
+                    # Cada página continua do cursor da anterior: só o que aparece na tela é montado
+                    feed_items, cursor = [], None
+                    with metricas.cronometro("feed.pagina"):
+                        for _ in range(st.session_state["paginas_feed"]):
+                            pagina, cursor = motor_feed.pagina(quem_sigo, 10, cursor)
+                            feed_items += pagina
+                            if cursor is None: break
                     if not feed_items: st.info("Seus amigos ainda não postaram nada.")
                     else:
-                        db_perfis = ler_arquivo_github(ARQUIVO_DB_PERFIL, 'json')
                         for item in feed_items:
                             u, viags = item['usuario'], item['viagens']
-                            perf = db_perfis.get(u, {})
+                            perf = diretorio_perfis.perfil(u) or {}
                             with st.container():
-                                st.markdown(f"""<div class="activity-card"><div class="activity-header"><span class="user-avatar">{perf.get('avatar', '👤')}</span><span class="user-name">{perf.get('display_name', u)}</span><span class="activity-time">{viags[0]['datetime_full'].strftime('%d/%m %H:%M')}</span></div>""", unsafe_allow_html=True)
+                                st.markdown(f"""<div class="activity-card"><div class="activity-header"><span class="user-avatar">{perf.get('avatar', '👤')}</span><span class="user-name">{perf.get('display_name', u)}</span><span class="activity-time">{viags[0]['dt'].strftime('%d/%m %H:%M')}</span></div>""", unsafe_allow_html=True)
                                 if len(viags) > 1:
                                     with st.expander(f"🚌 {len(viags)} Ônibus (Integração)"):
                                         for v in viags: st.markdown(f"**{v['hora'][:5]}** - {v['linha']}")
@@ -626,63 +562,77 @@ if st.session_state["logado"]:
                                     obs = f"<div style='color:#888; font-size:12px; margin-left:30px;'>📝 {v['obs']}</div>" if pd.notna(v['obs']) and v['obs'] else ""
                                     st.markdown(f"<div style='color:#fff; font-weight:bold; font-size:16px; margin-left:30px;'>{v['linha']}</div>{obs}", unsafe_allow_html=True)
                                 st.markdown("</div>", unsafe_allow_html=True)
+                        if cursor is not None:
+                            if st.button("Carregar +", key="mais_feed"): st.session_state["paginas_feed"]+=1; st.rerun()
             else: st.info("Feed vazio.")
 
         with aba_nova:
+            metricas.etapa("aba_nova")
             k = st.session_state["form_key"]
+            # Busca no servidor: o selectbox recebe só as melhores sugestões, não o catálogo inteiro
+            busca_linha = st.text_input("Buscar linha", key=f"bl_{k}", placeholder="Número ou nome da linha...")
             with st.form(f"n_{k}"):
                 c1, c2 = st.columns(2)
                 data = c1.date_input("Data", agora_br(), format="DD/MM/YYYY") 
                 hora = c2.time_input("Hora", value=datetime_time(0, 0))
-                linha = st.selectbox("Linha", [""] + lista_linhas)
+                linha = st.selectbox("Linha", [""] + sugerir_linhas(meu_user, busca_linha))
                 st.markdown('<div class="privacy-warning">⚠ Atenção: Este diário é público.</div>', unsafe_allow_html=True)
                 obs = st.text_area("Obs", height=68, max_chars=50)
                 if st.form_submit_button("Salvar Viagem", use_container_width=True):
                     if not linha: st.error("Escolha a linha!")
                     else:
-                        df_atual = st.session_state["cache_viagens"]
-                        novo_dado = pd.DataFrame([{ "usuario": meu_user, "linha": linha, "data": str(data), "hora": str(hora)[:5], "obs": obs, "timestamp": str(agora_br()) }])
-                        df_final = pd.concat([df_atual, novo_dado], ignore_index=True)
-                        df_final['datetime_temp'] = pd.to_datetime(df_final['data'].astype(str)+' '+df_final['hora'].astype(str), errors='coerce')
-                        df_final = df_final.sort_values(by=['usuario', 'datetime_temp'], ascending=[True, False]).drop(columns=['datetime_temp'])
-                        st.session_state["cache_viagens"] = df_final
-                        t = threading.Thread(target=salvar_background, args=(df_final.copy(),))
-                        t.start()
+                        registro = { "id": viagens_db.gerar_id(), "usuario": meu_user, "linha": linha, "data": str(data), "hora": str(hora)[:5], "obs": obs, "timestamp": str(agora_br()) }
+                        loja_viagens.adicionar(registro)
+                        salvar_background(registro=registro)
                         tocar_buzina()
                         st.success("Salvo!"); st.session_state["form_key"]+=1; time.sleep(0.5); st.rerun()
 
         with aba_diario:
-            df = st.session_state["cache_viagens"]
-            if not df.empty:
-                dff = df[df['usuario'] == meu_user].copy()
-                dff['dt'] = pd.to_datetime(dff['data'].astype(str)+' '+dff['hora'].astype(str), errors='coerce')
-                dff = dff.dropna(subset=['dt']).sort_values(by='dt', ascending=False)
-                
+            metricas.etapa("aba_diario")
+            if loja_viagens.usuarios():
+                # Partição já ordenada por dt desc, com dt parseado na ingestão
                 ft = st.pills("Filtro:", ["Tudo", "7 Dias", "30 Dias", "Este Ano"], default="Tudo")
-                h = agora_br()
-                if ft=="7 Dias": dff=dff[dff['dt']>=(h-timedelta(days=7))]
-                elif ft=="30 Dias": dff=dff[dff['dt']>=(h-timedelta(days=30))]
-                elif ft=="Este Ano": dff=dff[dff['dt'].dt.year==h.year]
-                
-                lim = st.session_state["limite_registros"]
-                view = dff.head(lim)
-                if dff.empty: st.info("Nada aqui.")
+                desde, ate = janela_diario(ft, agora_br())
+                # Pilha com o cursor de início de cada página visitada; filtro novo volta para a primeira
+                if st.session_state.get("filtro_diario") != ft:
+                    st.session_state["filtro_diario"] = ft
+                    st.session_state["cursores_diario"] = [None]
+                cursores = st.session_state["cursores_diario"]
+                with metricas.cronometro("diario.pagina"): view, proximo = loja_viagens.pagina_diario(meu_user, TAMANHO_PAGINA_DIARIO, cursores[-1], desde, ate)
+                if view.empty: st.info("Nada aqui.")
                 else:
                     for (y, m), g in view.groupby([view['dt'].dt.year, view['dt'].dt.month], sort=False):
                         st.markdown(f"<div class='month-header'>{MESES_PT[m]} {y}</div>", unsafe_allow_html=True)
-                        for i, r in g.iterrows():
+                        for _, r in g.iterrows():
                             o = f" • {r['obs']}" if pd.notna(r['obs']) and r['obs'] else ""
                             c1, c2 = st.columns([0.88, 0.12])
                             c1.markdown(f"""<div class="journal-card"><div class="strip"></div><div class="date-col">{r['dt'].day}</div><div class="info-col"><div class="bus-line">{r['linha']}</div><div class="meta-info">🕒 {str(r['hora'])[:5]}{o}</div></div></div>""", unsafe_allow_html=True)
-                            if c2.button("❌", key=f"d_{i}"):
-                                excluir_registro_rapido(i); st.rerun()
-                    if len(dff) > lim:
-                        if st.button("Carregar +"): st.session_state["limite_registros"]+=10; st.rerun()
+                            if c2.button("❌", key=f"d_{r['id']}"):
+                                excluir_registro_rapido(meu_user, r['id']); st.rerun()
+                    nav_ant, nav_prox = st.columns(2)
+                    if len(cursores) > 1 and nav_ant.button("◂ Mais recentes", use_container_width=True):
+                        cursores.pop(); st.rerun()
+                    if proximo is not None and nav_prox.button("Mais antigas ▸", use_container_width=True):
+                        cursores.append(proximo); st.rerun()
+                    # O CSV só é montado quando o botão é clicado
+                    st.download_button("⬇️ Exportar CSV", data=lambda: viagens_db.csv_viagens(loja_viagens.viagens_usuario(meu_user)), file_name=f"buslog_viagens_{meu_user}.csv", mime="text/csv", use_container_width=True)
             else: st.info("Vazio.")
+            # Um CSV exportado volta para o diário de quem importa; ids já gravados são ignorados
+            with st.expander("⬆️ Importar CSV"):
+                if "msg_importacao" in st.session_state: st.success(st.session_state.pop("msg_importacao"))
+                arquivo_csv = st.file_uploader("CSV exportado do BusLog", type="csv", key=f"imp_{st.session_state['form_key']}")
+                if arquivo_csv is not None and st.button("Importar", use_container_width=True):
+                    try: total = loja_viagens.importar_csv(arquivo_csv.getvalue(), meu_user)
+                    except Exception: st.error("Não foi possível ler o arquivo.")
+                    else:
+                        st.session_state["msg_importacao"] = f"{total} viagens importadas." if total else "Nenhuma viagem nova."
+                        st.session_state["cursores_diario"] = [None]; st.session_state["form_key"] += 1; st.rerun()
 
         with aba_notif:
+            metricas.etapa("aba_notif")
             if nao_lidas > 0:
                 if st.button("Marcar todas como lidas"): marcar_todas_lidas(meu_user); st.rerun()
+            minhas_notifs = caixas_notificacoes.listar(meu_user)
             if not minhas_notifs: st.info("Nenhuma notificação.")
             else:
                 for notif in minhas_notifs:
@@ -696,17 +646,16 @@ if st.session_state["logado"]:
                         st.markdown("---")
         
         with aba_reports:
+            metricas.etapa("aba_reports")
             st.markdown("### 📊 Gerar Relatório")
             st.caption("Crie um card bonito para compartilhar nas redes sociais.")
             
             periodo = st.selectbox("Escolha o período:", [7, 30, 180, 365], format_func=lambda x: f"Últimos {x} dias")
             
             if st.button("Gerar Card", use_container_width=True):
-                df_viagens = st.session_state["cache_viagens"]
-                if not df_viagens.empty:
-                    df_meu = df_viagens[df_viagens['usuario'] == meu_user].copy()
-                    with st.spinner("Desenhando card..."):
-                        imagem_buffer = gerar_card_stats(df_meu, meu_user, periodo)
+                if loja_viagens.usuarios():
+                    with st.spinner("Desenhando card..."), metricas.cronometro("card"):
+                        imagem_buffer = cache_cards.obter(meu_user, periodo, agora_br())
                     if imagem_buffer:
                         st.image(imagem_buffer, caption="Seu relatório BusLog", use_container_width=True)
                         st.download_button(label="⬇️ Baixar Imagem (PNG)", data=imagem_buffer, file_name=f"buslog_report_{meu_user}.png", mime="image/png", use_container_width=True)
@@ -714,13 +663,13 @@ if st.session_state["logado"]:
                 else: st.warning("Nenhuma viagem registrada ainda.")
 
         with aba_perfil:
+            metricas.etapa("aba_perfil")
             p = carregar_perfil(meu_user)
-            lista_seguidores, lista_seguindo = get_seguidores_count(meu_user)
+            qtd_seguidores, qtd_seguindo = get_seguidores_count(meu_user)
             
             # --- LÓGICA DE GAMIFICAÇÃO NO MEU PERFIL ---
-            df_viagens = st.session_state["cache_viagens"]
-            df_meu = df_viagens[df_viagens['usuario'] == meu_user] if not df_viagens.empty else pd.DataFrame()
-            stats = calcular_gamificacao(df_meu, total_linhas_sistema)
+            stats_meu = loja_viagens.estatisticas(meu_user)
+            with metricas.cronometro("calcular_gamificacao"): stats = gamificacao.calcular_gamificacao(stats_meu, total_linhas_sistema)
             
             if "edit_p" not in st.session_state: st.session_state["edit_p"] = False
             
@@ -744,7 +693,7 @@ if st.session_state["logado"]:
 
                 if st.session_state["ver_lista_seguidores"]:
                     tipo_lista = st.session_state["ver_lista_seguidores"]
-                    lista_exibir = lista_seguidores if tipo_lista == 'seguidores' else lista_seguindo
+                    lista_exibir = grafo_social.seguidores(meu_user) if tipo_lista == 'seguidores' else grafo_social.seguindo(meu_user)
                     st.write(f"**{tipo_lista.capitalize()}:**")
                     for u in lista_exibir:
                         if st.button(f"@{u}", key=f"minha_lista_{u}"):
@@ -754,15 +703,10 @@ if st.session_state["logado"]:
                     if st.button("Fechar Lista", key="fechar_minha"): st.session_state["ver_lista_seguidores"] = None; st.rerun()
                 else:
                     c1, c2, c3, c4 = st.columns(4)
-                    if c1.button(f"Seguidores: {len(lista_seguidores)}", key="meus_segs"): st.session_state["ver_lista_seguidores"] = "seguidores"; st.rerun()
-                    if c2.button(f"Seguindo: {len(lista_seguindo)}", key="meus_segd"): st.session_state["ver_lista_seguidores"] = "seguindo"; st.rerun()
+                    if c1.button(f"Seguidores: {qtd_seguidores}", key="meus_segs"): st.session_state["ver_lista_seguidores"] = "seguidores"; st.rerun()
+                    if c2.button(f"Seguindo: {qtd_seguindo}", key="meus_segd"): st.session_state["ver_lista_seguidores"] = "seguindo"; st.rerun()
                     
-                    dfv = st.session_state["cache_viagens"]
-                    tot, fav = 0, "-"
-                    if not dfv.empty:
-                        dm = dfv[dfv['usuario']==meu_user]
-                        tot = len(dm)
-                        if not dm.empty: fav = dm['linha'].mode()[0]
+                    tot, fav = stats_meu.total, stats_meu.linha_favorita(catalogo_linhas) or "-"
                     c3.markdown(f"<div class='stat-box'><div class='stat-label'>Viagens</div><div class='stat-value'>{tot}</div></div>", unsafe_allow_html=True)
                     c4.markdown(f"<div class='stat-box'><div class='stat-label'>Linha Fav.</div><div class='stat-value-small'>{fav}</div></div>", unsafe_allow_html=True)
                     
@@ -779,14 +723,16 @@ if st.session_state["logado"]:
                     if c2.form_submit_button("Cancelar"): st.session_state["edit_p"]=False; st.rerun()
 
 else:
+    metricas.etapa("login")
     tab1, tab2 = st.tabs(["Entrar", "Criar Conta"])
     with tab1:
         u = st.text_input("Usuário")
         p = st.text_input("Senha", type="password")
         if st.button("ENTRAR", use_container_width=True):
             with st.spinner("..."):
-                if fazer_login(u, p): st.session_state["logado"]=True; st.session_state["usuario_atual"]=u.lower().strip(); st.rerun()
-                else: st.error("Erro.")
+                ok, msg = fazer_login(u, p)
+                if ok: st.session_state["logado"]=True; st.session_state["usuario_atual"]=u.lower().strip(); st.rerun()
+                else: st.error(msg)
     with tab2:
         st.warning("⚠ Anote sua senha!")
         cu = st.text_input("Usuário novo")
@@ -801,3 +747,42 @@ else:
                     suc, msg = registrar_usuario(cu, cp)
                     if suc: st.success(msg)
                     else: st.error(msg)
+
+# --- DESEMPENHO ---
+def medidores_armazenamento():
+    # Números dos outros componentes para a exportação: leituras e gravações do armazenamento,
+    # fila de escrita (por arquivo), cache de leituras e chamadas ao GitHub (se for o backend) e cache de cards
+    tempos = backend.tempos.metricas()
+    medidores = [("armazenamento_chamadas_total", "operacao", {n: m["chamadas"] for n, m in tempos.items()}),
+                 ("armazenamento_segundos_total", "operacao", {n: m["total"] for n, m in tempos.items()})]
+    por_arquivo = backend.metricas()
+    for chave in sorted({k for m in por_arquivo.values() for k in m}):
+        medidores.append((f"fila_{chave}", "arquivo", {a: m[chave] for a, m in por_arquivo.items() if chave in m}))
+    destino = backend.backend
+    if getattr(destino, "cache", None) is not None: medidores.append(("cache_leitura", "medida", destino.cache.metricas()))
+    if getattr(destino, "latencias", None) is not None:
+        latencias = destino.latencias.metricas()
+        medidores.append(("github_chamadas_total", "chamada", {n: m["chamadas"] for n, m in latencias.items()}))
+        medidores.append(("github_segundos_total", "chamada", {n: m["total"] for n, m in latencias.items()}))
+    medidores.append(("cache_cards", "medida", cache_cards.metricas()))
+    return medidores
+
+def mostrar_desempenho(total_rerun):
+    with st.expander("🛠️ Desempenho"):
+        st.caption(f"Este rerun: {total_rerun * 1000:.0f} ms")
+        trechos = metricas.trechos_rerun()
+        if trechos:
+            st.dataframe(pd.DataFrame([{"trecho": n, "ms": round(s * 1000, 1)} for n, s in trechos]), hide_index=True, use_container_width=True)
+        st.caption("Processo (desde o início)")
+        # Leituras e gravações reais do armazenamento entram junto com os trechos da página
+        resumo = {**metricas.resumo(), **{f"armazenamento.{n}": m for n, m in backend.tempos.metricas().items()}}
+        resumo = sorted(resumo.items(), key=lambda item: -item[1]["total"])
+        st.dataframe(pd.DataFrame([{"trecho": n, "chamadas": m["chamadas"], "média (ms)": round(m["media"] * 1000, 1), "máx (ms)": round(m["maximo"] * 1000, 1)}
+                                   for n, m in resumo]), hide_index=True, use_container_width=True)
+        st.download_button("⬇️ Métricas (Prometheus)", data=lambda: instrumentacao.texto_prometheus(metricas, medidores_armazenamento()),
+                           file_name="buslog_metricas.txt", mime="text/plain", use_container_width=True)
+
+pagina_atual = "login" if not st.session_state["logado"] else ("visitante" if st.session_state["perfil_visitado"] else "principal")
+total_rerun = metricas.finalizar_rerun(pagina_atual, LOG_METRICAS)
+if painel_desempenho is not None:
+    with painel_desempenho: mostrar_desempenho(total_rerun)
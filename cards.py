@@ -0,0 +1,145 @@
+import io
+import atexit
+import textwrap
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+from matplotlib.figure import Figure
+from matplotlib.gridspec import GridSpec
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+# --- CARD DE ESTATÍSTICAS ---
+# Desenhado com a API orientada a objetos (Figure + FigureCanvasAgg), sem o estado
+# global do pyplot: cada card tem a sua figura e várias sessões podem desenhar ao
+# mesmo tempo. As cores são todas explícitas, no lugar do plt.style "dark_background".
+
+PERIODOS = (7, 30, 180, 365)
+DIAS_PT = {0: 'Seg', 1: 'Ter', 2: 'Qua', 3: 'Qui', 4: 'Sex', 5: 'Sáb', 6: 'Dom'}
+BG_COLOR = '#1c1c1e'
+TEXT_COLOR = '#ffffff'
+SUB_TEXT_COLOR = '#aaaaaa'
+ORANGE_COLOR = '#ff7f0e'
+
+def renderizar_card(df_user, nome_exibicao, dias, agora):
+    # -> PNG (bytes) ou None se não há viagens no período
+    df_filtrado = df_user[df_user['dt'] >= agora - timedelta(days=dias)]
+    if df_filtrado.empty: return None
+
+    total_viagens = len(df_filtrado)
+    contagem_linhas = df_filtrado['linha'].value_counts()
+    contagem_linhas = contagem_linhas[contagem_linhas > 0].head(5) # linha é categórica: ignora linhas fora do período
+    contagem_dias = df_filtrado['dt'].dt.weekday.map(DIAS_PT).value_counts().sort_values(ascending=True)
+
+    fig = Figure(figsize=(8, 8), facecolor=BG_COLOR, edgecolor='#333333', linewidth=4)
+    FigureCanvasAgg(fig)
+
+    gs = GridSpec(1, 2, figure=fig, width_ratios=[1.3, 0.7])
+    ax_left = fig.add_subplot(gs[0])
+    ax_right = fig.add_subplot(gs[1])
+
+    ax_left.set_facecolor(BG_COLOR)
+    ax_right.set_facecolor(BG_COLOR)
+    ax_left.axis('off')
+    ax_right.axis('off')
+
+    left_anchor = 0.05
+    ax_left.text(left_anchor, 0.94, "buslog.streamlit.app", ha='left', va='center', fontsize=20, color=TEXT_COLOR, weight='bold', transform=ax_left.transAxes)
+    ax_left.text(left_anchor, 0.89, f"@{nome_exibicao} • Últimos {dias} dias", ha='left', va='center', fontsize=12, color=SUB_TEXT_COLOR, transform=ax_left.transAxes)
+    ax_left.plot([left_anchor, 0.9], [0.85, 0.85], color='#444', transform=ax_left.transAxes, linewidth=1)
+
+    ax_left.text(left_anchor, 0.72, f"{total_viagens}", ha='left', va='bottom', fontsize=70, color=TEXT_COLOR, weight='bold', transform=ax_left.transAxes)
+    ax_left.text(left_anchor, 0.68, "VIAGENS NO PERÍODO", ha='left', va='top', fontsize=12, color=SUB_TEXT_COLOR, transform=ax_left.transAxes)
+
+    ax_left.text(left_anchor, 0.55, "TOP LINHAS", ha='left', va='center', fontsize=14, color=TEXT_COLOR, weight='bold', transform=ax_left.transAxes)
+
+    y_pos = 0.48
+    for linha, count in contagem_linhas.items():
+        wrapped_name = textwrap.fill(linha, width=28)
+        ax_left.text(left_anchor, y_pos, wrapped_name, ha='left', va='top', fontsize=11, color=TEXT_COLOR, transform=ax_left.transAxes, linespacing=1.2)
+        ax_left.text(0.9, y_pos, f"{count}x", ha='right', va='top', fontsize=11, color=SUB_TEXT_COLOR, weight='bold', transform=ax_left.transAxes)
+        num_lines = len(wrapped_name.split('\n'))
+        y_pos -= (0.04 * num_lines) + 0.03
+
+    ax_right.text(0.5, 0.55, "POR DIA DA SEMANA", ha='center', va='center', fontsize=12, color=TEXT_COLOR, weight='bold', transform=ax_right.transAxes)
+
+    inset_ax = ax_right.inset_axes([0.1, 0.05, 0.8, 0.45])
+    inset_ax.set_facecolor(BG_COLOR)
+
+    if not contagem_dias.empty:
+        dias_labels = contagem_dias.index.tolist()
+        valores_dias = contagem_dias.values.tolist()
+        y_positions = range(len(dias_labels))
+
+        bars_dias = inset_ax.barh(y_positions, valores_dias, color=ORANGE_COLOR)
+        inset_ax.set_yticks(y_positions)
+        inset_ax.set_yticklabels(dias_labels)
+
+        for spine in inset_ax.spines.values(): spine.set_visible(False)
+        inset_ax.set_xticks([])
+        inset_ax.tick_params(axis='y', colors=TEXT_COLOR, labelsize=11, length=0)
+
+        for bar in bars_dias:
+            width = bar.get_width()
+            inset_ax.text(width + 0.1, bar.get_y() + bar.get_height()/2, f'{int(width)}', va='center', color=TEXT_COLOR, fontsize=10, weight='bold')
+    else:
+        inset_ax.text(0.5, 0.5, "Sem dados", ha='center', va='center', color=SUB_TEXT_COLOR)
+        inset_ax.axis('off')
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', dpi=150, facecolor=fig.get_facecolor(), edgecolor=fig.get_edgecolor())
+    return buf.getvalue()
+
+
+# --- CACHE DE CARDS ---
+# LRU (usuario, período, versão dos dados do usuário, dia) -> PNG. A versão vem da loja
+# de viagens e muda a cada viagem nova ou removida; o dia entra na chave porque a
+# janela "últimos N dias" anda com o calendário. Pedidos iguais saem do cache.
+# pre_renderizar() desenha os cards de vários usuários numa thread de fundo.
+
+class CacheCards:
+    def __init__(self, loja, capacidade=128):
+        self.loja = loja
+        self.capacidade = capacidade
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self.acertos = self.falhas = 0
+        self._parar = threading.Event()
+
+    def obter(self, usuario, dias, agora):
+        chave = (usuario, dias, self.loja.versao_usuario(usuario), agora.date())
+        with self._lock:
+            if chave in self._entradas:
+                self._entradas.move_to_end(chave)
+                self.acertos += 1
+                return self._entradas[chave]
+            self.falhas += 1
+        png = renderizar_card(self.loja.viagens_usuario(usuario), usuario, dias, agora)
+        with self._lock:
+            self._entradas[chave] = png
+            while len(self._entradas) > self.capacidade: self._entradas.popitem(last=False)
+        return png
+
+    def pre_renderizar(self, usuarios, relogio, periodos=PERIODOS):
+        # relogio() -> datetime "agora" no fuso do app
+        for usuario in usuarios:
+            for dias in periodos:
+                if self._parar.is_set(): return
+                self.obter(usuario, dias, relogio())
+
+    def iniciar_pre_renderizacao(self, usuarios, relogio, periodos=PERIODOS):
+        # Só o que cabe no cache: além disso os primeiros cards seriam descartados pelos últimos
+        usuarios = list(usuarios)[:self.capacidade // len(periodos)]
+        t = threading.Thread(target=self.pre_renderizar, args=(usuarios, relogio, periodos), daemon=True, name="pre-render-cards")
+        t.start()
+        # Na saída do processo a thread termina o card em andamento e para, em vez de ser
+        # interrompida no meio do desenho (o que derruba o interpretador)
+        atexit.register(self._encerrar, t)
+        return t
+
+    def _encerrar(self, thread, timeout=5):
+        self._parar.set()
+        thread.join(timeout)
+
+    def metricas(self):
+        with self._lock:
+            return {"entradas": len(self._entradas), "acertos": self.acertos, "falhas": self.falhas}
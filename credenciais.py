@@ -0,0 +1,117 @@
+import time
+import bcrypt
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# --- CREDENCIAIS ---
+# Contas num dict do processo (usuario -> conta), lido uma vez de usuarios.json mais o log
+# usuarios.delta.jsonl (armazenamento.LogJson): criar conta ou trocar o hash anexa uma linha.
+# O bcrypt roda num pool pequeno de threads (ele solta o GIL), então o processo nunca calcula
+# mais que `trabalhadores` hashes ao mesmo tempo. Hashes com custo diferente de `rodadas`
+# são refeitos no próximo login certo. Cada usuário verifica uma senha por vez e, depois de
+# LIMITE_FALHAS erros seguidos, espera um tempo que dobra a cada erro novo.
+
+LIMITE_FALHAS = 5
+BLOQUEIO_MAXIMO = 300     # segundos
+INTERVALO_RECARGA = 30    # usuário desconhecido relê o log no máximo uma vez nesse intervalo
+
+def aplicar_ops_contas(base, ops):
+    contas = dict(base)
+    for op in ops:
+        # Duas criações do mesmo usuário (processos diferentes): vale a primeira
+        if op["op"] == "+": contas.setdefault(op["usuario"], op["conta"])
+        elif op["usuario"] in contas: contas[op["usuario"]] = {**contas[op["usuario"]], "password": op["password"]}
+    return contas
+
+def custo_hash(hashed):
+    # "$2b$12$..." -> 12
+    try: return int(hashed.split("$")[2])
+    except (IndexError, ValueError): return None
+
+# O bcrypt só usa os primeiros 72 bytes; as versões antigas cortavam sozinhas, a 5.x recusa
+def _senha_bytes(senha): return senha.encode("utf-8")[:72]
+
+class Credenciais:
+    def __init__(self, log, rodadas=12, trabalhadores=2):
+        self.log = log
+        self.rodadas = rodadas
+        self.carregado = False
+        self._contas = {}
+        self._recarregado_em = 0.0
+        self._falhas = {}
+        self._verificando = set()
+        self._pool = ThreadPoolExecutor(max_workers=trabalhadores, thread_name_prefix="bcrypt")
+        self._lock = threading.Lock()
+
+    def recarregar(self):
+        contas = aplicar_ops_contas(*self.log.carregar())
+        with self._lock:
+            self._contas = contas
+            self._recarregado_em = time.monotonic()
+            self.carregado = True
+
+    def _conta(self, usuario):
+        conta = self._contas.get(usuario)
+        if conta is None and time.monotonic() - self._recarregado_em > INTERVALO_RECARGA:
+            # Pode ter sido criada por outro processo
+            self.recarregar()
+            conta = self._contas.get(usuario)
+        return conta
+
+    def existe(self, usuario): return self._conta(usuario) is not None
+
+    def _hash(self, senha): return bcrypt.hashpw(_senha_bytes(senha), bcrypt.gensalt(self.rodadas)).decode()
+
+    def espera(self, usuario):
+        # Segundos de bloqueio que faltam (0 = liberado)
+        _, ate = self._falhas.get(usuario, (0, 0.0))
+        return max(0.0, ate - time.monotonic())
+
+    def _falhou(self, usuario):
+        with self._lock:
+            falhas = self._falhas.get(usuario, (0, 0.0))[0] + 1
+            bloqueio = min(2 ** (falhas - LIMITE_FALHAS), BLOQUEIO_MAXIMO) if falhas >= LIMITE_FALHAS else 0
+            self._falhas[usuario] = (falhas, time.monotonic() + bloqueio)
+
+    def verificar(self, usuario, senha):
+        # -> (ok, segundos de espera). Bloqueado ou com outra verificação em andamento: nem roda o bcrypt
+        espera = self.espera(usuario)
+        if espera: return False, espera
+        conta = self._conta(usuario)
+        if conta is None: return False, 0
+        with self._lock:
+            if usuario in self._verificando: return False, 1
+            self._verificando.add(usuario)
+        try: ok = self._pool.submit(bcrypt.checkpw, _senha_bytes(senha), conta["password"].encode()).result()
+        finally:
+            with self._lock: self._verificando.discard(usuario)
+        if not ok:
+            self._falhou(usuario)
+            return False, 0
+        with self._lock: self._falhas.pop(usuario, None)
+        if custo_hash(conta["password"]) != self.rodadas: self._pool.submit(self._refazer_hash, usuario, senha)
+        return True, 0
+
+    def _refazer_hash(self, usuario, senha):
+        novo = self._hash(senha)
+        with self._lock:
+            conta = self._contas.get(usuario)
+            if conta is None: return
+            self._contas[usuario] = {**conta, "password": novo}
+        self._persistir({"op": "senha", "usuario": usuario, "password": novo}, f"Hash atualizado: {usuario}")
+
+    def criar(self, usuario, senha, criado_em, junto=()):
+        # -> False se o usuário já existe. junto: alterações gravadas no mesmo commit (ex.: o perfil)
+        if self.existe(usuario): return False
+        conta = {"password": self._pool.submit(self._hash, senha).result(), "created_at": criado_em}
+        with self._lock:
+            if usuario in self._contas: return False
+            self._contas[usuario] = conta
+        self._persistir({"op": "+", "usuario": usuario, "conta": conta}, f"Novo usuario: {usuario}", junto)
+        return True
+
+    def _persistir(self, op, mensagem_commit, junto=()):
+        self.log.anexar(op, mensagem_commit, junto)
+        if self.log.precisa_compactar(): threading.Thread(target=self.compactar).start()
+
+    def compactar(self): self.log.compactar(aplicar_ops_contas, "Compactacao usuarios")
@@ -0,0 +1,134 @@
+import heapq
+import bisect
+import threading
+import numpy as np
+import pandas as pd
+from viagens_db import JANELA_INTEGRACAO, MES_SEM_DATA, clusterizar, ordenar_para_clusters
+
+# --- AGRUPAMENTO DE INTEGRAÇÕES ---
+# Viagens do mesmo usuário com até 2h entre uma e outra viram um único item do feed.
+# Os clusters saem de clusterizar() (diff/cumsum sobre timestamps int64); os dicts
+# das viagens só são montados para os itens que realmente vão aparecer.
+
+def item_feed(viagens):
+    return { "usuario": viagens[0]['usuario'], "datetime_ref": viagens[0]['dt'], "viagens": viagens }
+
+def montar_item(df_ordenado, inicio, fim):
+    return item_feed(df_ordenado.iloc[inicio:fim].to_dict('records')[::-1])
+
+def agrupar_viagens_atividade(df_viagens):
+    if df_viagens.empty: return []
+    df_ordenado, ts, grupos = ordenar_para_clusters(df_viagens)
+    _, inicios, fins = clusterizar(ts, grupos)
+    registros = df_ordenado.to_dict('records')
+    # Mais recente primeiro (estável, para empates manterem a ordem por usuário)
+    ordem = np.argsort(-ts[fins - 1], kind="stable")
+    return [item_feed(registros[inicios[c]:fins[c]][::-1]) for c in ordem]
+
+
+# --- MOTOR DO FEED ---
+# Mantém os clusters de cada usuário, em ordem do mais novo para o mais antigo, montados
+# mês a mês: a primeira página só lê (e agrupa) os meses mais recentes de cada seguido, e
+# um mês mais antigo só é pedido à loja quando o merge chega nele. Cada mês vira um
+# BlocoMes; o cluster mais antigo de um bloco pode continuar no mês anterior (integração
+# na virada do mês), então ele só sai na página depois que o mês anterior foi lido.
+# Uma escrita invalida só o mês dela na loja: os blocos dos outros meses são reaproveitados
+# (o DataFrame do mês é o mesmo objeto) e só aquele mês é reagrupado.
+# Cada cluster tem uma chave (-datetime_ref, usuario, id) crescente, usada para o
+# merge entre seguidos (heap) e como cursor de paginação.
+
+JANELA_NS = pd.Timedelta(JANELA_INTEGRACAO).value
+
+class BlocoMes:
+    def __init__(self, df):
+        self.origem = df
+        self.df, self.ts, _ = ordenar_para_clusters(df)
+        _, inicios, fins = clusterizar(self.ts)
+        # Do mais novo para o mais antigo
+        self.inicios, self.fins = inicios[::-1], fins[::-1]
+
+class ClustersUsuario:
+    def __init__(self, usuario, loja, blocos_anteriores=None):
+        self.usuario = usuario
+        self.loja = loja
+        self.versao = loja.versao_usuario(usuario)
+        meses = loja.meses_usuario(usuario)
+        # Viagens com data fora do padrão não têm mês no manifesto: a partição inteira vira um bloco só
+        self._meses = [None] if MES_SEM_DATA in meses else meses
+        self._proximo = 0
+        self._anteriores = blocos_anteriores or {}
+        self.blocos = {}
+        self.chaves = []
+        self.partes = []   # por cluster: [(df, inicio, fim)], do trecho mais novo para o mais antigo
+        self._mais_antigo = None
+        self._lock = threading.Lock()
+
+    def _bloco(self, mes):
+        df = self.loja.viagens_usuario(self.usuario) if mes is None else self.loja.viagens_mes(self.usuario, mes)
+        bloco = self._anteriores.get(mes)
+        if bloco is None or bloco.origem is not df: bloco = BlocoMes(df)
+        self.blocos[mes] = bloco
+        return bloco
+
+    def _carregar_mes(self):
+        bloco = self._bloco(self._meses[self._proximo])
+        ids = bloco.df["id"].values
+        for c, (inicio, fim) in enumerate(zip(bloco.inicios, bloco.fins)):
+            trecho = (bloco.df, inicio, fim)
+            # O cluster mais novo do bloco emenda no mais antigo do mês seguinte se estiver a até 2h
+            if c == 0 and self._mais_antigo is not None and self._mais_antigo - bloco.ts[fim - 1] <= JANELA_NS:
+                self.partes[-1].append(trecho)
+                continue
+            self.chaves.append((-int(bloco.ts[fim - 1]), self.usuario, ids[fim - 1]))
+            self.partes.append([trecho])
+        if len(bloco.ts): self._mais_antigo = int(bloco.ts[0])
+        self._proximo += 1
+
+    def prontos(self):
+        # Clusters completos: o mais antigo carregado ainda pode crescer enquanto houver mês por ler
+        return len(self.chaves) if self._proximo == len(self._meses) else max(len(self.chaves) - 1, 0)
+
+    def garantir(self, c):
+        # Lê meses até o cluster c estar completo; False se ele não existe
+        if c < self.prontos(): return True
+        with self._lock:
+            while c >= self.prontos() and self._proximo < len(self._meses): self._carregar_mes()
+            return c < self.prontos()
+
+    def item(self, c):
+        viagens = []
+        for df, inicio, fim in self.partes[c]: viagens.extend(df.iloc[inicio:fim].to_dict('records')[::-1])
+        return item_feed(viagens)
+
+def _a_partir(clusters, cursor):
+    # Pula o que vem antes do cursor (lendo meses só até passar dele)
+    c = 0
+    while clusters.garantir(c):
+        if cursor is not None and clusters.chaves[c] <= cursor:
+            c = max(c + 1, bisect.bisect_right(clusters.chaves, cursor, c, clusters.prontos()))
+            continue
+        yield clusters.chaves[c], clusters, c
+        c += 1
+
+class MotorFeed:
+    def __init__(self, loja):
+        self.loja = loja
+        self._por_usuario = {}
+        self._lock = threading.Lock()
+
+    def clusters_usuario(self, usuario):
+        cache = self._por_usuario.get(usuario)
+        if cache is not None and cache.versao == self.loja.versao_usuario(usuario): return cache
+        clusters = ClustersUsuario(usuario, self.loja, cache.blocos if cache is not None else None)
+        with self._lock: self._por_usuario[usuario] = clusters
+        return clusters
+
+    def pagina(self, usuarios, limite=10, cursor=None):
+        # Merge k-way só até encher a página: cada seguido lê só os meses que chegam a aparecer nela
+        fontes = [_a_partir(self.clusters_usuario(u), cursor) for u in set(usuarios)]
+        pagina, ultima = [], None
+        for chave, clusters, c in heapq.merge(*fontes, key=lambda t: t[0]):
+            if len(pagina) == limite: return pagina, ultima
+            pagina.append(clusters.item(c))
+            ultima = chave
+        return pagina, None
@@ -0,0 +1,51 @@
+import linhas
+
+# --- LÓGICA DE GAMIFICAÇÃO ---
+# Lê o agregado materializado da loja (viagens_db.EstatisticasUsuario): nada de varrer as viagens
+def calcular_gamificacao(stats, total_linhas_sistema):
+    if stats.total <= 0:
+        return {
+            "nivel": 1, "xp_total": 0, "xp_prox": 100, "progresso_nivel": 0,
+            "linhas_unicas": 0, "total_linhas": total_linhas_sistema, "badges": []
+        }
+    
+    # 1. CÁLCULO DE XP
+    total_viagens = stats.total
+    qtd_linhas_unicas = len(stats.linhas)
+    
+    # XP Base: 10 por viagem, 20 por linha única
+    xp = (total_viagens * 10) + (qtd_linhas_unicas * 20)
+    nivel = int(xp / 100) + 1
+    xp_prox_nivel = nivel * 100
+    progresso_nivel = (xp % 100) / 100 # Porcentagem 0.0 a 1.0
+
+    # 2. CÁLCULO DE BADGES
+    badges = []
+    
+    # Badge: Veterano (50+ viagens)
+    if total_viagens >= 50: badges.append("🚌 Veterano")
+    
+    # Badge: Explorador (10+ linhas diferentes)
+    if qtd_linhas_unicas >= 10: badges.append("🌍 Explorador")
+    
+    # Badge: Corujão (Viagens 00h-05h)
+    if stats.madrugada >= 1: badges.append("🦉 Corujão")
+    
+    # Badge: Ferroviário (Trem/Metrô/VLT)
+    if stats.viagens_modal(linhas.FERROVIARIO) >= 1: badges.append("🚆 Ferroviário")
+    
+    # Badge: Expresso (BRT)
+    if stats.viagens_modal(linhas.BRT) >= 1: badges.append("🚄 Expresso")
+    
+    # Badge: Marujo (Barcas)
+    if stats.viagens_modal(linhas.BARCA) >= 1: badges.append("⚓ Marujo")
+
+    return {
+        "nivel": nivel,
+        "xp_total": xp,
+        "xp_prox": xp_prox_nivel,
+        "progresso_nivel": progresso_nivel,
+        "linhas_unicas": qtd_linhas_unicas,
+        "total_linhas": total_linhas_sistema,
+        "badges": badges
+    }
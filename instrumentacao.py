@@ -0,0 +1,117 @@
+import json
+import time
+import logging
+import threading
+import functools
+from contextlib import contextmanager
+from armazenamento import Latencias
+
+logger = logging.getLogger(__name__)
+
+# --- INSTRUMENTAÇÃO ---
+# Tempos e contadores dos trechos quentes de um rerun. Cada trecho medido soma no agregado
+# do processo (armazenamento.Latencias: chamadas, total, máximo, última) e, quando roda na
+# thread do script, na lista do rerun atual. etapa() é um cronômetro de voltas: marca o início
+# de um pedaço da página e fecha o anterior, sem precisar reindentar o código da interface.
+# Saídas: texto no formato do Prometheus e uma linha JSON por rerun no log.
+
+class Instrumentacao:
+    def __init__(self):
+        self.tempos = Latencias()
+        self._contadores = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def iniciar_rerun(self):
+        self._local.trechos = []
+        self._local.etapa = None
+        self._local.inicio = time.perf_counter()
+
+    def _registrar(self, nome, segundos):
+        self.tempos.registrar(nome, segundos)
+        trechos = getattr(self._local, "trechos", None)
+        if trechos is not None: trechos.append((nome, segundos))
+
+    @contextmanager
+    def cronometro(self, nome):
+        inicio = time.perf_counter()
+        try: yield
+        except Exception:
+            self.contar(f"{nome}.erros")
+            raise
+        finally: self._registrar(nome, time.perf_counter() - inicio)
+
+    def medir(self, nome=None):
+        # Decorador: cronometra cada chamada da função
+        def decorador(fn):
+            trecho = nome or fn.__name__
+            @functools.wraps(fn)
+            def medida(*args, **kwargs):
+                with self.cronometro(trecho): return fn(*args, **kwargs)
+            return medida
+        return decorador
+
+    def etapa(self, nome):
+        # Fecha a etapa aberta nesta thread e abre `nome` (None só fecha)
+        agora = time.perf_counter()
+        aberta = getattr(self._local, "etapa", None)
+        if aberta: self._registrar(aberta[0], agora - aberta[1])
+        self._local.etapa = (nome, agora) if nome else None
+
+    def contar(self, nome, n=1):
+        with self._lock: self._contadores[nome] = self._contadores.get(nome, 0) + n
+
+    def contadores(self):
+        with self._lock: return dict(self._contadores)
+
+    def resumo(self): return self.tempos.metricas()
+
+    def trechos_rerun(self): return list(getattr(self._local, "trechos", ()))
+
+    def duracao_rerun(self):
+        inicio = getattr(self._local, "inicio", None)
+        return time.perf_counter() - inicio if inicio is not None else 0.0
+
+    def finalizar_rerun(self, pagina, log=False):
+        # Fecha a última etapa, soma o rerun inteiro e, se pedido, grava a linha JSON no log
+        self.etapa(None)
+        total = self.duracao_rerun()
+        self.tempos.registrar("rerun", total)
+        if log:
+            logger.info(json.dumps({"evento": "rerun", "pagina": pagina, "segundos": round(total, 4),
+                                    "trechos": [[n, round(s, 4)] for n, s in self.trechos_rerun()]}, ensure_ascii=False))
+        return total
+
+def ativar_log(nivel=logging.INFO):
+    # As linhas JSON saem no stderr do servidor, uma por rerun
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+    logger.setLevel(nivel)
+
+
+# --- EXPORTAÇÃO (PROMETHEUS) ---
+# medidores: (nome, rótulo, {alvo: valor}) com números de outros componentes, ex.:
+# ("fila_flushes", "arquivo", {"perfil.json": 3}) vira buslog_fila_flushes{arquivo="perfil.json"} 3
+
+def _escapar(valor): return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+def _numero(valor): return str(valor) if isinstance(valor, int) else repr(float(valor))
+
+def texto_prometheus(instrumentacao, medidores=(), prefixo="buslog"):
+    saida = []
+
+    def familia(nome, tipo, rotulo, amostras):
+        amostras = [(alvo, v) for alvo, v in amostras if isinstance(v, (int, float)) and not isinstance(v, bool)]
+        if not amostras: return
+        saida.append(f"# TYPE {prefixo}_{nome} {tipo}")
+        saida.extend(f'{prefixo}_{nome}{{{rotulo}="{_escapar(alvo)}"}} {_numero(v)}' for alvo, v in amostras)
+
+    tempos = sorted(instrumentacao.resumo().items())
+    familia("trecho_chamadas_total", "counter", "trecho", [(n, m["chamadas"]) for n, m in tempos])
+    familia("trecho_segundos_total", "counter", "trecho", [(n, m["total"]) for n, m in tempos])
+    familia("trecho_segundos_max", "gauge", "trecho", [(n, m["maximo"]) for n, m in tempos])
+    familia("eventos_total", "counter", "evento", sorted(instrumentacao.contadores().items()))
+    for nome, rotulo, valores in medidores: familia(nome, "gauge", rotulo, sorted(valores.items()))
+    return "\n".join(saida) + "\n"
@@ -0,0 +1,71 @@
+import re
+import threading
+import numpy as np
+import pandas as pd
+
+# --- CATÁLOGO DE LINHAS ---
+# Cada nome de linha ganha um id inteiro compacto e um conjunto de flags de modal,
+# calculados uma única vez (as regras são as mesmas usadas pelas badges).
+# Linhas que não estão no rotasrj.json (registros antigos) entram no catálogo na hora.
+
+TREM, METRO, VLT, BRT, BARCA, ONIBUS = 1, 2, 4, 8, 16, 32
+FERROVIARIO = TREM | METRO | VLT
+MODAIS = (TREM, METRO, VLT, BRT, BARCA, ONIBUS)
+REGRAS_MODAL = (
+    (TREM, re.compile("Trem|Ramal", re.IGNORECASE)),
+    (METRO, re.compile("Metrô", re.IGNORECASE)),
+    (VLT, re.compile("VLT", re.IGNORECASE)),
+    (BRT, re.compile("BRT", re.IGNORECASE)),
+    (BARCA, re.compile("Barca", re.IGNORECASE)),
+)
+
+def classificar_linha(nome):
+    flags = 0
+    for bit, regex in REGRAS_MODAL:
+        if regex.search(nome): flags |= bit
+    return flags or ONIBUS
+
+class CatalogoLinhas:
+    def __init__(self, nomes=()):
+        self.nomes = []
+        self.ids = {}
+        self.flags = np.zeros(0, dtype=np.uint8)
+        self._lock = threading.Lock()
+        for nome in nomes: self.registrar(nome)
+
+    def __len__(self): return len(self.nomes)
+
+    def registrar(self, nome):
+        if not isinstance(nome, str): nome = ""
+        id_linha = self.ids.get(nome)
+        if id_linha is not None: return id_linha
+        with self._lock:
+            if nome in self.ids: return self.ids[nome]
+            id_linha = len(self.nomes)
+            flags = np.append(self.flags, np.uint8(classificar_linha(nome) if nome else 0))
+            self.nomes = self.nomes + [nome]
+            # flags/nomes são trocados por cópias: leitores concorrentes nunca veem array pela metade
+            self.flags = flags
+            self.ids[nome] = id_linha
+            return id_linha
+
+    def nome(self, id_linha): return self.nomes[id_linha]
+
+    def codificar(self, serie):
+        # Nomes -> ids, classificando só os nomes distintos da série
+        cat = pd.Categorical(serie)
+        mapa = np.array([self.registrar(n) for n in cat.categories] + [self.registrar("")], dtype=np.int32)
+        return mapa[cat.codes]
+
+
+# --- PESOS PARA A BUSCA ---
+# Linhas que o usuário mais usa e as que usou por último sobem no ranking da busca.
+
+BONUS_RECENTES = 10
+
+def pesos_usuario(contagem_linhas, ids_recentes):
+    # contagem_linhas: id -> nº de viagens; ids_recentes: ids das últimas viagens, mais nova primeiro
+    pesos = dict(contagem_linhas)
+    for pos, id_linha in enumerate(ids_recentes):
+        pesos[id_linha] = pesos.get(id_linha, 0) + max(BONUS_RECENTES - pos, 1)
+    return pesos
@@ -0,0 +1,109 @@
+import json
+import threading
+from collections import deque
+from urllib.parse import quote
+
+# --- CAIXAS DE NOTIFICAÇÕES ---
+# Uma caixa por usuário em notificacoes/<usuario>.json, mais nova primeiro e limitada às
+# LIMITE_CAIXA últimas. Cada notificação ganha um número de sequência crescente e
+# "lidas_ate" é a marca d'água: seq <= lidas_ate está lida, então "marcar todas como lidas"
+# só move a marca. O contador de não lidas e o índice (from_user, type) -> seq da mais nova
+# andam junto com a lista: nada disso varre a caixa.
+
+LIMITE_CAIXA = 100
+
+class Caixa:
+    def __init__(self, itens=(), seq=0, lidas_ate=0):
+        self.itens = deque(itens)
+        self.seq = seq
+        self.lidas_ate = lidas_ate
+        self._ultima = {}
+        for n in reversed(self.itens): self._ultima[(n["from_user"], n["type"])] = n["seq"]
+        self.nao_lidas = sum(1 for n in self.itens if n["seq"] > lidas_ate)
+
+    @classmethod
+    def de_json(cls, dados): return cls(dados.get("itens", ()), dados.get("seq", 0), dados.get("lidas_ate", 0))
+    def para_json(self): return {"seq": self.seq, "lidas_ate": self.lidas_ate, "itens": list(self.itens)}
+
+    def lida(self, notificacao): return notificacao["seq"] <= self.lidas_ate
+
+    def adicionar(self, from_user, tipo, timestamp, limite=LIMITE_CAIXA):
+        # Como antes: não repete uma notificação igual que ainda não foi lida
+        if self._ultima.get((from_user, tipo), 0) > self.lidas_ate: return False
+        self.seq += 1
+        self.itens.appendleft({"seq": self.seq, "from_user": from_user, "type": tipo, "timestamp": timestamp})
+        self._ultima[(from_user, tipo)] = self.seq
+        self.nao_lidas += 1
+        while len(self.itens) > limite:
+            velha = self.itens.pop()
+            if velha["seq"] > self.lidas_ate: self.nao_lidas -= 1
+            chave = (velha["from_user"], velha["type"])
+            if self._ultima.get(chave) == velha["seq"]: del self._ultima[chave]
+        return True
+
+    def marcar_lidas(self):
+        if not self.nao_lidas: return False
+        self.lidas_ate, self.nao_lidas = self.seq, 0
+        return True
+
+def caixa_legada(lista):
+    # notificacoes.json antigo: lista mais nova primeiro com "read" em cada item. A marca
+    # d'água fica na mais nova já lida (o app só marcava todas de uma vez, então as de baixo também estão)
+    itens, lidas_ate = [], 0
+    for pos, n in enumerate(lista):
+        seq = len(lista) - pos
+        itens.append({"seq": seq, "from_user": n["from_user"], "type": n.get("type", "follow"), "timestamp": n.get("timestamp", "")})
+        if n.get("read") and not lidas_ate: lidas_ate = seq
+    return Caixa(itens[:LIMITE_CAIXA], len(lista), lidas_ate)
+
+class CaixasNotificacoes:
+    def __init__(self, backend, pasta="notificacoes", legado=None):
+        self.backend = backend
+        self.pasta = pasta
+        self.legado = legado
+        self._caixas = {}
+        self._legado = None
+        self._lock = threading.Lock()
+
+    def caminho(self, usuario): return f"{self.pasta}/{quote(str(usuario), safe='')}.json"
+
+    def _dados_legado(self):
+        # Lido uma vez: quem ainda não tem caixa própria começa pela sua lista no arquivo antigo
+        if self._legado is None:
+            conteudo = self.backend.ler(self.legado) if self.legado else None
+            self._legado = json.loads(conteudo.decode("utf-8")) if conteudo else {}
+        return self._legado
+
+    def _ler(self, usuario, conteudo):
+        if conteudo: return Caixa.de_json(json.loads(conteudo.decode("utf-8")))
+        return caixa_legada(self._dados_legado().get(usuario, []))
+
+    def caixa(self, usuario):
+        caixa = self._caixas.get(usuario)
+        if caixa is None:
+            caixa = self._ler(usuario, self.backend.ler(self.caminho(usuario)))
+            with self._lock: caixa = self._caixas.setdefault(usuario, caixa)
+        return caixa
+
+    def listar(self, usuario):
+        caixa = self.caixa(usuario)
+        with self._lock: itens = list(caixa.itens)
+        return [dict(n, read=caixa.lida(n)) for n in itens]
+
+    def _alteracao(self, usuario, aplicar):
+        # aplicar(caixa) -> False se nada mudou. Roda já na caixa em memória e, na fila de
+        # escrita, de novo sobre o arquivo relido; sem mudança não há alteração (None)
+        caixa = self.caixa(usuario)
+        with self._lock:
+            if aplicar(caixa) is False: return None
+
+        def transformar(atual):
+            caixa = self._ler(usuario, atual)
+            if aplicar(caixa) is False and atual: return atual
+            return json.dumps(caixa.para_json(), ensure_ascii=False, indent=4)
+        return (self.caminho(usuario), "transformar", transformar)
+
+    def alteracao_nova(self, destino, from_user, tipo, timestamp):
+        return self._alteracao(destino, lambda caixa: caixa.adicionar(from_user, tipo, timestamp))
+
+    def alteracao_lidas(self, usuario): return self._alteracao(usuario, Caixa.marcar_lidas)
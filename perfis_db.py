@@ -0,0 +1,50 @@
+import json
+import threading
+import busca
+
+# --- DIRETÓRIO DE PERFIS ---
+# perfil.json lido uma vez por processo e atualizado na memória a cada perfil salvo.
+# A busca de usuários usa um busca.IndiceBusca (prefixo sobre tokens sem acento) com o
+# @usuario e o nome de exibição, refeito na primeira busca depois de uma mudança.
+
+class DiretorioPerfis:
+    def __init__(self, backend, arquivo):
+        self.backend = backend
+        self.arquivo = arquivo
+        self.carregado = False
+        self.versao = 0
+        self._perfis = {}
+        self._indice = (-1, None)
+        self._lock = threading.Lock()
+
+    def recarregar(self):
+        conteudo = self.backend.ler(self.arquivo)
+        perfis = json.loads(conteudo.decode("utf-8")) if conteudo else {}
+        with self._lock:
+            self._perfis = perfis
+            self.versao += 1
+            self.carregado = True
+
+    def __len__(self): return len(self._perfis)
+
+    def perfil(self, usuario): return self._perfis.get(usuario)
+
+    def atualizar(self, usuario, perfil):
+        with self._lock:
+            self._perfis[usuario] = perfil
+            self.versao += 1
+
+    def _indice_busca(self):
+        versao, indice = self._indice
+        if versao == self.versao: return indice
+        with self._lock:
+            versao = self.versao
+            documentos = [(u, f"{u} {p.get('display_name', '')}") for u, p in self._perfis.items()]
+        indice = busca.IndiceBusca(documentos)
+        # Uma mudança durante a montagem deixa o índice velho de fora: a próxima busca refaz
+        if versao == self.versao: self._indice = (versao, indice)
+        return indice
+
+    def buscar(self, consulta, k=8):
+        if not busca.tokenizar(consulta): return []
+        return [u for u, _ in self._indice_busca().buscar(consulta, k)]
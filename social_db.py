@@ -0,0 +1,62 @@
+import threading
+
+# --- GRAFO SOCIAL ---
+# Adjacência nos dois sentidos (quem cada um segue e quem segue cada um), com dicts
+# usados como conjuntos ordenados: seguir, deixar de seguir e contar seguidores são O(1).
+# Persistência: social.json é o snapshot (usuario -> lista de quem ele segue) e cada
+# follow/unfollow vira uma linha no social.delta.jsonl (armazenamento.LogJson).
+
+def aplicar_ops_social(base, ops):
+    seguindo = {u: dict.fromkeys(lista) for u, lista in base.items()}
+    for op in ops:
+        alvos = seguindo.setdefault(op["de"], {})
+        if op["op"] == "+": alvos[op["para"]] = None
+        else: alvos.pop(op["para"], None)
+    return seguindo
+
+class GrafoSocial:
+    def __init__(self, log):
+        self.log = log
+        self.carregado = False
+        self._seguindo = {}
+        self._seguidores = {}
+        self._lock = threading.Lock()
+
+    def recarregar(self):
+        seguindo = aplicar_ops_social(*self.log.carregar())
+        seguidores = {}
+        for u, alvos in seguindo.items():
+            for alvo in alvos: seguidores.setdefault(alvo, {})[u] = None
+        with self._lock:
+            self._seguindo, self._seguidores = seguindo, seguidores
+            self.carregado = True
+
+    def segue(self, eu, outro): return outro in self._seguindo.get(eu, ())
+    def seguindo(self, usuario): return list(self._seguindo.get(usuario, ()))
+    def seguidores(self, usuario): return list(self._seguidores.get(usuario, ()))
+    def qtd_seguindo(self, usuario): return len(self._seguindo.get(usuario, ()))
+    def qtd_seguidores(self, usuario): return len(self._seguidores.get(usuario, ()))
+
+    def seguir(self, eu, outro, junto=()):
+        # junto: alterações em outros arquivos (ex.: a notificação) gravadas no mesmo commit
+        with self._lock:
+            if self.segue(eu, outro): return False
+            self._seguindo.setdefault(eu, {})[outro] = None
+            self._seguidores.setdefault(outro, {})[eu] = None
+        self._persistir({"op": "+", "de": eu, "para": outro}, junto)
+        return True
+
+    def deixar_seguir(self, eu, outro):
+        with self._lock:
+            if not self.segue(eu, outro): return False
+            del self._seguindo[eu][outro]
+            del self._seguidores[outro][eu]
+        self._persistir({"op": "-", "de": eu, "para": outro})
+        return True
+
+    def _persistir(self, op, junto=()):
+        self.log.anexar(op, "Social update", junto)
+        if self.log.precisa_compactar(): threading.Thread(target=self.compactar).start()
+
+    def compactar(self):
+        self.log.compactar(lambda base, ops: {u: list(alvos) for u, alvos in aplicar_ops_social(base, ops).items()}, "Compactacao social")
@@ -0,0 +1,55 @@
+import shutil
+import pytest
+import armazenamento
+
+pytestmark = pytest.mark.skipif(shutil.which("git") is None, reason="precisa do executável git")
+
+def commits(backend): return int(backend._git("rev-list", "--count", backend.ramo).stdout)
+
+def test_transacao_grava_tudo_num_commit(tmp_path):
+    backend = armazenamento.BackendGitLocal(str(tmp_path / "dados.git"))
+    backend.escrever("log.jsonl", "a\n", "inicial")
+    backend.transacao([("log.jsonl", "anexar", "b\n"), ("novo.json", "escrever", "{}"),
+                       ("conta.txt", "transformar", lambda atual: (atual or b"") + b"1")], "lote")
+    assert commits(backend) == 2
+    assert backend.ler("log.jsonl") == b"a\nb\n"
+    assert backend.ler("novo.json") == b"{}"
+    assert backend.ler("conta.txt") == b"1"
+
+def test_transacao_refaz_o_lote_quando_o_ramo_anda(tmp_path):
+    backend = armazenamento.BackendGitLocal(str(tmp_path / "dados.git"))
+    backend.escrever("conta.txt", "0", "inicial")
+    chamadas = []
+
+    def incrementar(atual):
+        # Na primeira tentativa outro processo grava no meio: o commit do lote não é fast-forward
+        chamadas.append(atual)
+        if len(chamadas) == 1: backend.escrever("outro.txt", "x", "concorrente")
+        return str(int(atual) + 1)
+    backend.transacao([("conta.txt", "transformar", incrementar)], "incremento")
+    assert len(chamadas) == 2
+    assert backend.ler("conta.txt") == b"1"
+    assert backend.ler("outro.txt") == b"x"
+
+def test_versao_desatualizada_gera_conflito(tmp_path):
+    backend = armazenamento.BackendGitLocal(str(tmp_path / "dados.git"))
+    backend.escrever("a.txt", "1", "inicial")
+    _, versao = backend.ler_com_versao("a.txt")
+    backend.escrever("a.txt", "2", "outro processo")
+    with pytest.raises(armazenamento.ConflitoEscrita):
+        backend.escrever("a.txt", "3", "atrasado", versao=versao)
+    with pytest.raises(armazenamento.ConflitoEscrita):
+        backend.escrever_varios({"a.txt": "3", "b.txt": "3"}, "atrasado", versao=versao)
+    assert backend.ler("a.txt") == b"2"
+    assert backend.ler("b.txt") is None
+
+def test_fila_grava_transacao_num_commit(tmp_path):
+    backend = armazenamento.BackendGitLocal(str(tmp_path / "dados.git"))
+    fila = armazenamento.FilaEscrita(backend, intervalo_flush=0.01, espera_maxima=0.05)
+    fila.transacao([("viagens/ana/2024-01.csv", "anexar", "linha\n"), ("viagens/ana/manifesto.json", "escrever", '{"2024-01": 1}'),
+                    ("viagens/usuarios.json", "transformar", lambda atual: '["ana"]')], "Nova viagem: ana")
+    assert fila.esperar(timeout=5) is True
+    assert commits(backend) == 1
+    assert backend._git("log", "-1", "--format=%s", backend.ramo).stdout.decode().strip() == "Nova viagem: ana"
+    assert backend.ler("viagens/ana/2024-01.csv") == b"linha\n"
+    assert backend.ler("viagens/usuarios.json") == b'["ana"]'
@@ -0,0 +1,65 @@
+import json
+import armazenamento
+
+class BackendInstavel(armazenamento.BackendLocal):
+    # Recusa gravar os arquivos de `quebrados` enquanto o conjunto não for esvaziado
+    def __init__(self, diretorio, quebrados=()):
+        super().__init__(diretorio)
+        self.quebrados = set(quebrados)
+
+    def _substituir(self, caminho, conteudo):
+        if caminho in self.quebrados: raise OSError(f"disco recusou {caminho}")
+        return super()._substituir(caminho, conteudo)
+
+    def anexar(self, caminho, conteudo, mensagem_commit=None):
+        if caminho in self.quebrados: raise OSError(f"disco recusou {caminho}")
+        return super().anexar(caminho, conteudo, mensagem_commit)
+
+def fila(backend): return armazenamento.FilaEscrita(backend, intervalo_flush=0.01, espera_maxima=0.05)
+
+def test_falha_mantem_ops_e_esperar_devolve_false(tmp_path):
+    backend = BackendInstavel(str(tmp_path), {"social.json"})
+    f = fila(backend)
+    f.escrever("social.json", '{"a": 1}', "teste")
+    assert f.esperar("social.json", timeout=5) is False
+    assert "social.json" in f.falhas()
+    assert f.ler("social.json") == b'{"a": 1}'
+    assert backend.ler("social.json") is None
+    backend.quebrados.clear()
+    assert f.esperar("social.json", timeout=5) is True
+    assert backend.ler("social.json") == b'{"a": 1}'
+    assert f.falhas() == {}
+
+def test_compactacao_nao_zera_delta_sem_snapshot(tmp_path):
+    backend = BackendInstavel(str(tmp_path))
+    f = fila(backend)
+    log = armazenamento.LogJson(f, "social.json")
+    log.anexar({"op": "+", "x": 1}, "op")
+    assert f.esperar(timeout=5)
+    backend.quebrados.add("social.json")
+    log.compactar(lambda base, ops: {"ops": ops}, "compactacao")
+    assert backend.ler("social.json") is None
+    assert backend.ler("social.delta.jsonl").strip()
+    backend.quebrados.clear()
+    assert f.esperar(timeout=5)
+    assert json.loads(backend.ler("social.json")) == {"ops": [{"op": "+", "x": 1}]}
+    assert backend.ler("social.delta.jsonl").strip()
+
+def test_transformar_invalido_descarta_so_a_propria_op(tmp_path):
+    backend = BackendInstavel(str(tmp_path))
+    f = fila(backend)
+    f.anexar("manifesto.json", "a\n", "um")
+    f.transformar("manifesto.json", lambda atual: 1 / 0, "quebrada")
+    f.anexar("manifesto.json", "b\n", "dois")
+    assert f.esperar("manifesto.json", timeout=5)
+    assert backend.ler("manifesto.json") == b"a\nb\n"
+    assert f.metricas()["manifesto.json"]["descartadas"] == 1
+
+def test_transacao_invalida_sai_inteira(tmp_path):
+    backend = BackendInstavel(str(tmp_path))
+    f = fila(backend)
+    f.transacao([("a.json", "escrever", "1"), ("b.json", "transformar", lambda atual: 1 / 0)], "quebrada")
+    f.escrever("a.json", "2", "depois")
+    assert f.esperar(timeout=5)
+    assert backend.ler("a.json") == b"2"
+    assert backend.ler("b.json") is None
@@ -0,0 +1,38 @@
+import json
+import armazenamento
+import linhas
+import viagens_db
+
+def viagem(id_viagem, usuario, mes):
+    return {"id": id_viagem, "usuario": usuario, "linha": "100", "data": f"2024-{mes}-01", "hora": "10:00", "obs": "", "timestamp": "2024-01-01 10:00:00"}
+
+def loja_com(backend, *registros):
+    loja = viagens_db.LojaViagens(viagens_db.ShardsViagens(backend, "viagens"), linhas.CatalogoLinhas(["100"]))
+    loja.recarregar()
+    for r in registros:
+        loja.adicionar(r)
+        loja.armazem.anexar(r)
+    return loja
+
+def test_importar_csv_de_outro_usuario_gera_ids_novos(tmp_path):
+    loja = loja_com(armazenamento.BackendLocal(str(tmp_path)), viagem("a1", "lulu", "01"), viagem("a2", "lulu", "02"))
+    assert loja.importar_csv(viagens_db.csv_viagens(loja.viagens_usuario("lulu")).encode("utf-8"), "felipe") == 2
+    assert not set(loja.viagens_usuario("felipe")["id"]) & {"a1", "a2"}
+    # Reimportar o próprio export não duplica nada
+    assert loja.importar_csv(viagens_db.csv_viagens(loja.viagens_usuario("felipe")).encode("utf-8"), "felipe") == 0
+    # Remover a viagem de um usuário não mexe nas cópias do outro
+    removida = loja.remover("lulu", "a1")
+    loja.armazem.remover(removida)
+    assert len(loja.viagens_usuario("felipe")) == 2
+    assert loja.remover("felipe", "a2") is None
+
+def test_manifesto_por_usuario_e_lista_global(tmp_path):
+    backend = armazenamento.BackendLocal(str(tmp_path))
+    loja = loja_com(backend, viagem("a1", "lulu", "01"), viagem("b1", "bia", "03"))
+    assert json.loads(backend.ler("viagens/usuarios.json")) == ["bia", "lulu"]
+    assert json.loads(backend.ler("viagens/lulu/manifesto.json")) == {"2024-01": 1}
+    loja.armazem.remover(loja.remover("bia", "b1"))
+    assert json.loads(backend.ler("viagens/usuarios.json")) == ["lulu"]
+    recarregada = loja_com(backend)
+    assert recarregada.usuarios() == ["lulu"]
+    assert recarregada.meses_usuario("lulu") == ["2024-01"]
@@ -0,0 +1,668 @@
+import io
+import csv
+import json
+import uuid
+import heapq
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+from datetime import timedelta
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# --- LOG DE VIAGENS (APPEND-ONLY, FORMATO ANTIGO) ---
+# Hoje as viagens ficam em shards (ShardsViagens, abaixo); este formato só é lido para migrar.
+# O arquivo base (viagens.csv) é um snapshot compactado. Cada viagem nova ou
+# removida era uma linha no delta (viagens.delta.csv): "+" insere, "-" é tombstone.
+
+COLUNAS = ["id", "usuario", "linha", "data", "hora", "obs", "timestamp"]
+COLUNAS_DELTA = ["op"] + COLUNAS
+FORMATO_DT = "%Y-%m-%d %H:%M"
+JANELA_INTEGRACAO = timedelta(hours=2)
+
+def gerar_id(): return uuid.uuid4().hex[:16]
+
+def id_legado(usuario, timestamp):
+    # Linhas antigas do CSV não têm id: deriva um estável de usuario + timestamp de criação
+    return hashlib.sha1(f"{usuario}|{timestamp}".encode("utf-8")).hexdigest()[:16]
+
+def ler_csv_viagens(conteudo):
+    if not conteudo: return pd.DataFrame(columns=COLUNAS)
+    df = pd.read_csv(io.BytesIO(conteudo), dtype={"id": str, "data": str, "hora": str})
+    if "id" not in df.columns:
+        df.insert(0, "id", [id_legado(u, t) for u, t in zip(df["usuario"], df["timestamp"])])
+    return df
+
+# --- TIPAGEM ---
+# A coluna dt (datetime64) é derivada de data + hora uma única vez, na ingestão.
+# Ela não vai para o CSV: data/hora continuam sendo a fonte e dt é refeita ao ler.
+
+def parsear_datetime(data, hora):
+    texto = data.astype(str) + " " + hora.astype(str).str[:5]
+    # Caminho rápido com formato explícito; o que não casar cai no parser genérico
+    dt = pd.to_datetime(texto, format=FORMATO_DT, errors="coerce")
+    falhas = dt.isna() & data.notna() & hora.notna()
+    if falhas.any(): dt[falhas] = pd.to_datetime(texto[falhas], format="mixed", errors="coerce")
+    return dt
+
+def categorizar(df):
+    return df.astype({"usuario": "category", "linha": "category"})
+
+def tipar_viagens(df, catalogo=None):
+    # Com catálogo, cada viagem também ganha o id inteiro da sua linha (linha_id)
+    df = df.reset_index(drop=True)
+    # Formatos colunares já trazem dt pronto
+    if "dt" not in df.columns: df["dt"] = parsear_datetime(df["data"], df["hora"])
+    if catalogo is not None: df["linha_id"] = catalogo.codificar(df["linha"])
+    return categorizar(df)
+
+def df_vazio():
+    df = tipar_viagens(pd.DataFrame(columns=COLUNAS))
+    df["linha_id"] = np.empty(0, dtype=np.int32)
+    return df
+
+def ordenar_viagens(df):
+    # Ordem total (usuario asc, dt desc, id desc): é a ordem das chaves do cursor do diário
+    if df.empty: return df
+    return df.sort_values(by=["usuario", "dt", "id"], ascending=[True, False, False], kind="stable").reset_index(drop=True)
+
+# --- AGRUPAMENTO VETORIZADO ---
+# Viagens do mesmo usuário com até 2h entre uma e outra formam um cluster ("integração").
+# Entrada: timestamps int64 (ns) ordenados de forma crescente dentro de cada grupo, e
+# opcionalmente o código do grupo (usuário) de cada posição, com os grupos contíguos.
+# Saída: id do cluster de cada posição e os limites [inicio, fim) de cada cluster.
+
+def clusterizar(ts, grupos=None, janela=JANELA_INTEGRACAO):
+    ts = np.asarray(ts, dtype=np.int64)
+    n = len(ts)
+    if n == 0: return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.int64)
+    novo = np.empty(n, dtype=bool)
+    novo[0] = True
+    novo[1:] = np.diff(ts) > pd.Timedelta(janela).value
+    if grupos is not None:
+        grupos = np.asarray(grupos)
+        novo[1:] |= grupos[1:] != grupos[:-1]
+    ids = np.cumsum(novo) - 1
+    inicios = np.flatnonzero(novo)
+    fins = np.append(inicios[1:], n)
+    return ids, inicios, fins
+
+def ordenar_para_clusters(df):
+    # Ordena por (usuario, dt) crescente e devolve o df com os arrays prontos para clusterizar()
+    df = df.dropna(subset=["dt"])
+    df = df.sort_values(by=["usuario", "dt"], kind="stable").reset_index(drop=True)
+    grupos = pd.Categorical(df["usuario"]).codes if len(df) else np.empty(0, np.int8)
+    return df, df["dt"].values.astype("datetime64[ns]").view(np.int64), grupos
+
+def linha_csv(registro):
+    buf = io.StringIO()
+    csv.writer(buf, lineterminator="\n").writerow(["" if registro.get(c) is None else registro.get(c) for c in COLUNAS])
+    return buf.getvalue()
+
+def csv_viagens(df): return df[COLUNAS].to_csv(index=False)
+
+
+class LogViagens:
+    def __init__(self, backend, arquivo_base):
+        self.backend = backend
+        self.arquivo_base = arquivo_base
+        self.arquivo_delta = arquivo_base.rsplit(".", 1)[0] + ".delta.csv"
+
+    def _ler_delta(self):
+        conteudo = self.backend.ler(self.arquivo_delta)
+        if not conteudo: return pd.DataFrame(columns=COLUNAS_DELTA)
+        return pd.read_csv(io.BytesIO(conteudo), dtype={"op": str, "id": str, "data": str, "hora": str})
+
+    def carregar(self):
+        base = ler_csv_viagens(self.backend.ler(self.arquivo_base))
+        delta = self._ler_delta()
+        if delta.empty: return ordenar_viagens(tipar_viagens(base))
+        # Replay idempotente: vale a última operação de cada id
+        ultimas = delta.drop_duplicates(subset="id", keep="last")
+        removidos = set(ultimas.loc[ultimas["op"] == "-", "id"])
+        novos = ultimas[(ultimas["op"] == "+") & ~ultimas["id"].isin(base["id"])][COLUNAS]
+        base = base[~base["id"].isin(removidos)]
+        return ordenar_viagens(tipar_viagens(pd.concat([base, novos], ignore_index=True)))
+
+
+# --- FORMATOS DE ARQUIVO ---
+# Como um conjunto de viagens vira bytes num shard. "csv" é o formato de sempre (texto,
+# tipos inferidos na leitura). Os colunares guardam usuario, linha, data e hora com
+# codificação de dicionário, dt já como int64 (ns) e tudo comprimido: ler não decodifica
+# texto nem infere tipos. "npz" só precisa do NumPy; "parquet" precisa do pyarrow
+# (opcional) e, no backend local, lê o arquivo por memory map.
+
+class FormatoCsv:
+    nome, extensao, mapeavel = "csv", "csv", False
+
+    def ler(self, conteudo, caminho_local=None): return ler_csv_viagens(conteudo)
+    def gravar(self, df): return csv_viagens(df).encode("utf-8")
+
+    def anexar(self, atual, registro):
+        # Em texto dá para acrescentar a linha sem reler o shard
+        return (atual or (",".join(COLUNAS) + "\n").encode("utf-8")) + linha_csv(registro).encode("utf-8")
+
+class FormatoColunar:
+    def anexar(self, atual, registro):
+        novo = pd.DataFrame([registro], columns=COLUNAS)
+        novo["dt"] = parsear_datetime(novo["data"], novo["hora"])
+        return self.gravar(pd.concat([self.ler(atual), novo], ignore_index=True) if atual else novo)
+
+COLUNAS_DICIONARIO = ("usuario", "linha", "data", "hora")
+
+class FormatoNpz(FormatoColunar):
+    nome, extensao, mapeavel = "npz", "npz", False
+
+    def gravar(self, df):
+        if "dt" not in df.columns: df = df.assign(dt=parsear_datetime(df["data"], df["hora"]))
+        arrays = {"id": df["id"].astype(str).to_numpy(dtype=str),
+                  "dt": df["dt"].to_numpy(dtype="datetime64[ns]").view(np.int64),
+                  "obs": df["obs"].fillna("").astype(str).to_numpy(dtype=str),
+                  "timestamp": df["timestamp"].fillna("").astype(str).to_numpy(dtype=str)}
+        for col in COLUNAS_DICIONARIO:
+            cat = pd.Categorical(df[col].astype(object))
+            arrays[f"{col}.codigos"] = cat.codes.astype(np.int32)
+            arrays[f"{col}.categorias"] = np.asarray(cat.categories, dtype=str)
+        buf = io.BytesIO()
+        np.savez_compressed(buf, **arrays)
+        return buf.getvalue()
+
+    def ler(self, conteudo, caminho_local=None):
+        if not conteudo: return pd.DataFrame(columns=COLUNAS)
+        with np.load(io.BytesIO(conteudo), allow_pickle=False) as arq:
+            df = pd.DataFrame({"id": arq["id"].astype(object)})
+            for col in COLUNAS_DICIONARIO:
+                codigos, categorias = arq[f"{col}.codigos"], arq[f"{col}.categorias"]
+                if col in ("usuario", "linha"): df[col] = pd.Categorical.from_codes(codigos, categorias)
+                else: df[col] = np.append(categorias.astype(object), None)[codigos]  # -1 (ausente) vira None
+            obs = arq["obs"].astype(object)
+            df["obs"] = np.where(obs == "", None, obs)
+            df["timestamp"] = arq["timestamp"].astype(object)
+            df["dt"] = arq["dt"].view("datetime64[ns]")
+        return df[COLUNAS + ["dt"]]
+
+class FormatoParquet(FormatoColunar):
+    nome, extensao, mapeavel = "parquet", "parquet", True
+
+    def __init__(self):
+        if pq is None: raise RuntimeError("O formato parquet precisa do pacote pyarrow")
+
+    def gravar(self, df):
+        if "dt" not in df.columns: df = df.assign(dt=parsear_datetime(df["data"], df["hora"]))
+        df = df[COLUNAS + ["dt"]].astype({"usuario": "category", "linha": "category", "dt": "datetime64[ns]"})
+        buf = io.BytesIO()
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), buf, compression="zstd")
+        return buf.getvalue()
+
+    def ler(self, conteudo, caminho_local=None):
+        if caminho_local: tabela = pq.read_table(caminho_local, memory_map=True)
+        elif conteudo: tabela = pq.read_table(pa.BufferReader(conteudo))
+        else: return pd.DataFrame(columns=COLUNAS)
+        return tabela.to_pandas()
+
+FORMATOS = {"csv": FormatoCsv, "npz": FormatoNpz, "parquet": FormatoParquet}
+
+def obter_formato(nome):
+    if nome not in FORMATOS: raise ValueError(f"Formato de viagens desconhecido: {nome}")
+    return FORMATOS[nome]()
+
+
+# --- VIAGENS PARTICIONADAS (SHARDS) ---
+# Cada usuário tem um arquivo por mês: viagens/<usuario>/<AAAA-MM>.<extensão do formato>,
+# e um manifesto ao lado, viagens/<usuario>/manifesto.json: {"AAAA-MM": nº de viagens}.
+# viagens/usuarios.json é só a lista (compacta) de quem tem viagens: muda quando um usuário
+# ganha o primeiro mês ou perde o último. viagens/formato diz em que formato estão os
+# shards (sem o arquivo: csv). Ler um usuário custa só os arquivos dele; uma viagem nova
+# ou removida reescreve um único shard pequeno e o manifesto do dono no mesmo commit
+# (backend.transacao), nada que cresça com o número de usuários.
+# Na primeira carga sem a lista, o manifesto global antigo (viagens/manifesto.json) é
+# dividido por usuário ou, sem ele, as viagens do formato antigo (LogViagens) são
+# migradas para os shards; se o formato configurado mudou, os shards são convertidos.
+
+MES_SEM_DATA = "sem-data"
+
+def mes_da_viagem(data):
+    data = "" if data is None or (isinstance(data, float) and np.isnan(data)) else str(data)
+    return data[:7] if len(data) >= 7 and data[4] == "-" else MES_SEM_DATA
+
+def _json_lista(usuarios): return json.dumps(sorted(usuarios), ensure_ascii=False, separators=(",", ":"))
+
+class ShardsViagens:
+    def __init__(self, backend, pasta="viagens", legado=None, formato="csv", leituras_paralelas=4):
+        self.backend = backend
+        self.pasta = pasta
+        self.arquivo_usuarios = f"{pasta}/usuarios.json"
+        self.arquivo_manifesto_global = f"{pasta}/manifesto.json"   # formato antigo, só lido para migrar
+        self.arquivo_formato = f"{pasta}/formato"
+        self.legado = legado
+        self.formato = obter_formato(formato)
+        # Os meses de um usuário são baixados em paralelo (um pool só dos shards)
+        self._pool = ThreadPoolExecutor(max_workers=leituras_paralelas, thread_name_prefix="shards") if leituras_paralelas > 1 else None
+
+    def caminho_shard(self, usuario, mes, formato=None):
+        # O nome do usuário vira um segmento de caminho seguro ("/", ".." etc. escapados)
+        return f"{self.pasta}/{quote(str(usuario), safe='')}/{mes}.{(formato or self.formato).extensao}"
+
+    def caminho_manifesto(self, usuario): return f"{self.pasta}/{quote(str(usuario), safe='')}/manifesto.json"
+
+    def _ler_json(self, caminho):
+        conteudo = self.backend.ler(caminho)
+        return json.loads(conteudo.decode("utf-8")) if conteudo else None
+
+    def carregar_usuarios(self): return self._ler_json(self.arquivo_usuarios)
+
+    def carregar_manifesto(self, usuario): return self._ler_json(self.caminho_manifesto(usuario)) or {}
+
+    def formato_gravado(self):
+        conteudo = self.backend.ler(self.arquivo_formato)
+        return conteudo.decode("utf-8").strip() if conteudo else "csv"
+
+    def _ler_shard(self, caminho, formato=None):
+        formato = formato or self.formato
+        # No backend local, sem escrita pendente, o formato pode ler direto do disco (memory map)
+        caminho_local = getattr(self.backend, "caminho_local", lambda c: None)(caminho) if formato.mapeavel else None
+        conteudo = None if caminho_local else self.backend.ler(caminho)
+        return formato.ler(conteudo, caminho_local)
+
+    def carregar_usuario(self, usuario, meses, formato=None):
+        caminhos = [self.caminho_shard(usuario, mes, formato) for mes in sorted(meses)]
+        if self._pool and len(caminhos) > 1: partes = list(self._pool.map(lambda c: self._ler_shard(c, formato), caminhos))
+        else: partes = [self._ler_shard(c, formato) for c in caminhos]
+        partes = [p for p in partes if not p.empty]
+        return pd.concat(partes, ignore_index=True) if partes else pd.DataFrame(columns=COLUNAS)
+
+    def _lista_usuarios(self, usuario, presente):
+        def alterar(atual):
+            usuarios = set(json.loads(atual.decode("utf-8")) if atual else ())
+            if presente: usuarios.add(usuario)
+            else: usuarios.discard(usuario)
+            return _json_lista(usuarios)
+        return (self.arquivo_usuarios, "transformar", alterar)
+
+    def _manifesto(self, usuario, deltas):
+        # deltas: {"AAAA-MM": variação}. O manifesto do dono sempre; a lista global só se
+        # o usuário passa a ter (ou deixa de ter) viagens, pelo manifesto lido agora
+        # (com a fila de escrita, já com as operações pendentes aplicadas)
+        def aplicar(meses):
+            meses = dict(meses)
+            for mes, delta in deltas.items():
+                meses[mes] = meses.get(mes, 0) + delta
+                if meses[mes] <= 0: del meses[mes]
+            return meses
+
+        def alterar(atual):
+            return json.dumps(aplicar(json.loads(atual.decode("utf-8")) if atual else {}), indent=4, sort_keys=True)
+        antes = self.carregar_manifesto(usuario)
+        alteracoes = [(self.caminho_manifesto(usuario), "transformar", alterar)]
+        if bool(antes) != bool(aplicar(antes)): alteracoes.append(self._lista_usuarios(usuario, not antes))
+        return alteracoes
+
+    def anexar(self, registro):
+        usuario, mes = registro["usuario"], mes_da_viagem(registro.get("data"))
+        formato = self.formato
+        self.backend.transacao([(self.caminho_shard(usuario, mes), "transformar", lambda atual: formato.anexar(atual, registro)),
+                                *self._manifesto(usuario, {mes: 1})], f"Nova viagem: {usuario}")
+
+    def remover(self, registro):
+        # registro: a viagem removida (usuario e data dizem em que shard ela está)
+        usuario, mes, id_viagem = registro["usuario"], mes_da_viagem(registro.get("data")), registro["id"]
+        formato = self.formato
+        def alterar(atual):
+            df = formato.ler(atual)
+            return formato.gravar(df[df["id"] != id_viagem])
+        self.backend.transacao([(self.caminho_shard(usuario, mes), "transformar", alterar), *self._manifesto(usuario, {mes: -1})],
+                               "Viagem removida")
+
+    def _shards(self, df):
+        df = df.assign(mes=[mes_da_viagem(d) for d in df["data"]])
+        for (usuario, mes), grupo in df.groupby(["usuario", "mes"], sort=True, observed=True):
+            yield str(usuario), mes, grupo.drop(columns="mes")
+
+    def _gravar_manifestos(self, manifesto, alteracoes, mensagem_commit):
+        # Manifestos por usuário e a lista no mesmo commit das `alteracoes`; se outro
+        # processo migrou antes, o que ele gravou prevalece
+        for usuario, meses in manifesto.items():
+            conteudo = json.dumps(meses, indent=4, sort_keys=True).encode("utf-8")
+            alteracoes.append((self.caminho_manifesto(usuario), "transformar", lambda atual, c=conteudo: atual or c))
+        lista = _json_lista(manifesto).encode("utf-8")
+        alteracoes.append((self.arquivo_usuarios, "transformar", lambda atual: atual or lista))
+        self.backend.transacao(alteracoes, mensagem_commit)
+        return sorted(manifesto)
+
+    def migrar(self):
+        # -> lista de usuários. O manifesto global antigo só é dividido; sem ele, o log antigo vira shards
+        global_ = self._ler_json(self.arquivo_manifesto_global)
+        if global_ is not None: return self._gravar_manifestos(global_, [], "Manifesto das viagens por usuario")
+        df = self.legado.carregar() if self.legado is not None else pd.DataFrame(columns=COLUNAS)
+        manifesto, alteracoes = {}, []
+        for usuario, mes, grupo in self._shards(df):
+            manifesto.setdefault(usuario, {})[mes] = len(grupo)
+            conteudo = self.formato.gravar(grupo.sort_values("dt", kind="stable"))
+            alteracoes.append((self.caminho_shard(usuario, mes), "transformar", lambda atual, c=conteudo: atual or c))
+        alteracoes.append((self.arquivo_formato, "escrever", self.formato.nome))
+        return self._gravar_manifestos(manifesto, alteracoes, "Migracao das viagens para shards")
+
+    def converter(self, usuarios):
+        # Regrava todos os shards no formato configurado (os do formato anterior ficam como estão)
+        anterior = obter_formato(self.formato_gravado())
+        alteracoes = []
+        for usuario in usuarios:
+            for mes in self.carregar_manifesto(usuario):
+                df = self._ler_shard(self.caminho_shard(usuario, mes, anterior), anterior)
+                alteracoes.append((self.caminho_shard(usuario, mes), "escrever", self.formato.gravar(df)))
+        alteracoes.append((self.arquivo_formato, "escrever", self.formato.nome))
+        self.backend.transacao(alteracoes, f"Conversao das viagens: {anterior.nome} -> {self.formato.nome}")
+
+    def importar_csv(self, conteudo, usuario=None):
+        # Mescla um CSV no layout de viagens.csv (id opcional): ids já gravados são ignorados.
+        # Com usuario, todas as linhas vão para ele (ex.: o CSV exportado do próprio diário);
+        # as que eram de outro usuário ganham id novo, para um id não ficar em duas contas.
+        # -> nº de viagens importadas
+        df = ler_csv_viagens(conteudo)
+        if usuario is not None:
+            alheias = df["usuario"].astype(str) != str(usuario) if "usuario" in df.columns else pd.Series(True, index=df.index)
+            df.loc[alheias, "id"] = [gerar_id() for _ in range(int(alheias.sum()))]
+            df["usuario"] = usuario
+        df = tipar_viagens(df)
+        formato = self.formato
+
+        def mesclar(atual, novos):
+            existente = formato.ler(atual)
+            novos = novos[~novos["id"].isin(existente["id"])]
+            return formato.gravar(pd.concat([existente[COLUNAS], novos], ignore_index=True)) if not novos.empty else atual
+        alteracoes, deltas, total = [], {}, 0
+        for dono, mes, grupo in self._shards(df):
+            caminho = self.caminho_shard(dono, mes)
+            # A contagem vem do shard lido agora; a mescla é refeita sobre o conteúdo da hora
+            # da escrita, então o que foi gravado no meio não se perde nem se duplica
+            novos = grupo[~grupo["id"].isin(self._ler_shard(caminho)["id"])].drop_duplicates(subset="id")[COLUNAS]
+            if novos.empty: continue
+            alteracoes.append((caminho, "transformar", lambda atual, novos=novos: mesclar(atual, novos)))
+            deltas.setdefault(dono, {})[mes] = len(novos)
+            total += len(novos)
+        for dono, meses in deltas.items(): alteracoes += self._manifesto(dono, meses)
+        if alteracoes: self.backend.transacao(alteracoes, "Importacao de viagens (CSV)")
+        return total
+
+
+# --- ESTATÍSTICAS POR USUÁRIO ---
+# Agregado materializado que alimenta XP, nível, badges e Busodex. É montado uma vez
+# na carga (bincount sobre os ids do catálogo de linhas) e atualizado em O(1) a cada
+# viagem inserida ou removida. linhas conta viagens por id de linha; modos conta
+# viagens pela combinação de flags de modal da linha (ver linhas.CatalogoLinhas).
+
+HORAS_MADRUGADA = (0, 1, 2, 3, 4)
+
+class EstatisticasUsuario:
+    __slots__ = ("total", "linhas", "madrugada", "modos")
+
+    def __init__(self):
+        self.total = 0
+        self.linhas = Counter()
+        self.madrugada = 0
+        self.modos = Counter()
+
+    def aplicar(self, id_linha, flags, dt, sinal=1):
+        self.total += sinal
+        self.linhas[id_linha] += sinal
+        if self.linhas[id_linha] <= 0: del self.linhas[id_linha]
+        self.modos[flags] += sinal
+        if self.modos[flags] <= 0: del self.modos[flags]
+        if pd.notna(dt) and dt.hour in HORAS_MADRUGADA: self.madrugada += sinal
+
+    def viagens_modal(self, mascara): return sum(q for flags, q in self.modos.items() if flags & mascara)
+
+    def linha_favorita(self, catalogo):
+        # Mesmo desempate de Series.mode(): maior contagem, depois ordem alfabética
+        if not self.linhas: return None
+        id_linha, _ = min(self.linhas.items(), key=lambda kv: (-kv[1], catalogo.nome(kv[0])))
+        return catalogo.nome(id_linha)
+
+def calcular_estatisticas(df, catalogo):
+    s = EstatisticasUsuario()
+    if df.empty: return s
+    ids = df["linha_id"].values
+    s.total = len(ids)
+    contagem = np.bincount(ids)
+    s.linhas = Counter({int(i): int(contagem[i]) for i in np.flatnonzero(contagem)})
+    contagem_modos = np.bincount(catalogo.flags[ids])
+    s.modos = Counter({int(f): int(contagem_modos[f]) for f in np.flatnonzero(contagem_modos)})
+    s.madrugada = int(df["dt"].dt.hour.isin(HORAS_MADRUGADA).sum())
+    return s
+
+
+# --- DIÁRIO (PAGINAÇÃO POR CURSOR) ---
+# A partição de um usuário já está em ordem (dt desc, id desc), com as viagens sem data
+# no fim. O índice guarda os timestamps int64 negados (crescentes, para o searchsorted)
+# e os ids. O cursor é a chave (dt em ns, id) da última viagem da página anterior, e os
+# filtros de período viram limites [inicio, fim) pela mesma busca binária:
+# cada página custa O(log n + limite), qualquer que seja o tamanho do histórico.
+
+def _ns(momento): return pd.Timestamp(momento).as_unit("ns").value
+
+class IndiceDiario:
+    def __init__(self, df):
+        self.df = df
+        validos = int(df["dt"].notna().sum())
+        self._neg_ts = -df["dt"].values[:validos].astype("datetime64[ns]").view(np.int64)
+        self._ids = df["id"].values[:validos]
+
+    def pagina(self, limite, cursor=None, desde=None, ate=None):
+        # desde/ate: limites inclusivos do período (datetime) ou None
+        inicio = 0 if ate is None else int(np.searchsorted(self._neg_ts, -_ns(ate), "left"))
+        fim = len(self._neg_ts) if desde is None else int(np.searchsorted(self._neg_ts, -_ns(desde), "right"))
+        if cursor is not None:
+            ts_cursor, id_cursor = cursor
+            pos = int(np.searchsorted(self._neg_ts, -ts_cursor, "left"))
+            fim_empate = int(np.searchsorted(self._neg_ts, -ts_cursor, "right"))
+            # Empates de horário (ids em ordem desc): só os ids menores que o do cursor ainda não foram mostrados
+            menores = int(np.searchsorted(self._ids[pos:fim_empate][::-1], id_cursor, "left"))
+            inicio = max(inicio, fim_empate - menores)
+        fim_pagina = min(inicio + limite, fim)
+        proximo = (int(-self._neg_ts[fim_pagina - 1]), str(self._ids[fim_pagina - 1])) if fim_pagina < fim else None
+        return self.df.iloc[inicio:max(inicio, fim_pagina)], proximo
+
+
+# --- LOJA COMPARTILHADA ---
+# Uma única cópia das viagens por processo, compartilhada entre as sessões.
+# As viagens ficam particionadas por usuário (índice usuario -> DataFrame já
+# ordenado por data desc), então a visão de um usuário custa O(viagens dele).
+# As partições são carregadas sob demanda, lendo só os shards daquele usuário;
+# a lista de usuários diz quem tem viagens e o manifesto de cada um (lido na primeira
+# vez que se pergunta por ele) em que meses. Quem só precisa dos meses mais
+# recentes (o feed) pede mês a mês: viagens_mes() lê um shard só (ou recorta a partição,
+# se ela já está na memória) e guarda o resultado até uma escrita naquele mês.
+# Copy-on-write: escritas montam um DataFrame novo só da partição afetada e
+# trocam a referência; snapshots já entregues nunca são alterados.
+
+class LojaViagens:
+    def __init__(self, armazem, catalogo):
+        self.armazem = armazem
+        self.catalogo = catalogo
+        self.versao = 0
+        self.carregada = False
+        self._usuarios = set()
+        self._manifesto = {}
+        self._por_usuario = {}
+        self._stats = {}
+        self._indices = {}
+        self._versoes = {}
+        self._versao_carga = 0
+        self._por_mes = {}
+        self._lock = threading.Lock()
+        self._locks_carga = {}
+
+    def recarregar(self):
+        # Só a lista de usuários é lida agora; manifestos e partições são relidos quando alguém pedir
+        usuarios = self.armazem.carregar_usuarios()
+        if usuarios is None: usuarios = self.armazem.migrar()
+        elif self.armazem.formato_gravado() != self.armazem.formato.nome: self.armazem.converter(usuarios)
+        with self._lock:
+            self._usuarios, self._manifesto = set(usuarios), {}
+            self._por_usuario, self._stats, self._indices, self._versoes, self._por_mes = {}, {}, {}, {}, {}
+            self.versao += 1
+            self._versao_carga = self.versao
+            self.carregada = True
+
+    def _manifesto_usuario(self, usuario):
+        # {"AAAA-MM": nº de viagens} do usuário; um arquivo pequeno, lido uma vez por carga
+        meses = self._manifesto.get(usuario)
+        if meses is not None: return meses
+        if usuario not in self._usuarios: return {}
+        versao = self.versao_usuario(usuario)
+        meses = self.armazem.carregar_manifesto(usuario)
+        with self._lock:
+            # Uma escrita durante a leitura já atualizou o manifesto em memória: ele prevalece
+            if self.versao_usuario(usuario) != versao: return self._manifesto.get(usuario, meses)
+            return self._manifesto.setdefault(usuario, meses)
+
+    def _garantir(self, usuario):
+        if usuario in self._por_usuario or usuario not in self._usuarios: return
+        # Um lock por usuário: usuários diferentes carregam em paralelo, o mesmo usuário uma vez só
+        with self._lock: lock = self._locks_carga.setdefault(usuario, threading.Lock())
+        with lock:
+            if usuario in self._por_usuario: return
+            df = self.armazem.carregar_usuario(usuario, list(self._manifesto_usuario(usuario)))
+            df = ordenar_viagens(tipar_viagens(df, self.catalogo)) if not df.empty else df_vazio()
+            stats = calcular_estatisticas(df, self.catalogo)
+            with self._lock:
+                if usuario in self._por_usuario: return
+                if not df.empty: self._por_usuario[usuario] = df
+                self._stats[usuario] = stats
+
+    def viagens_usuario(self, usuario):
+        self._garantir(usuario)
+        df = self._por_usuario.get(usuario)
+        return df if df is not None else df_vazio()
+
+    def pagina_diario(self, usuario, limite=10, cursor=None, desde=None, ate=None):
+        # -> (DataFrame com até `limite` viagens, cursor da próxima página ou None)
+        df = self.viagens_usuario(usuario)
+        indice = self._indices.get(usuario)
+        # O índice vale enquanto a partição for o mesmo objeto (escritas trocam a referência)
+        if indice is None or indice.df is not df: indice = self._indices[usuario] = IndiceDiario(df)
+        return indice.pagina(limite, cursor, desde, ate)
+
+    def versao_usuario(self, usuario):
+        # Muda sempre que as viagens do usuário mudam (inclusive ao serem relidas do armazenamento); não carrega nada
+        return self._versoes.get(usuario, self._versao_carga)
+
+    def meses_usuario(self, usuario):
+        # Meses com viagens, do mais novo para o mais antigo (MES_SEM_DATA por último)
+        meses = self._manifesto_usuario(usuario)
+        with self._lock: meses = list(meses)
+        return sorted(meses, key=lambda m: (m != MES_SEM_DATA, m), reverse=True)
+
+    def viagens_mes(self, usuario, mes):
+        # Viagens de um mês "AAAA-MM" com dt, na ordem da partição (dt decrescente)
+        chave = (usuario, mes)
+        df = self._por_mes.get(chave)
+        if df is not None: return df
+        versao = self.versao_usuario(usuario)
+        particao = self._por_usuario.get(usuario)
+        if particao is not None:
+            # Partição já na memória (dt decrescente, sem data no fim): o mês é uma fatia contígua
+            inicio = pd.Timestamp(f"{mes}-01")
+            limites = np.array([inicio, inicio + pd.offsets.MonthBegin(1)], dtype="datetime64[ns]")
+            validos = len(particao) - int(particao["dt"].isna().sum())
+            crescente = particao["dt"].values[:validos][::-1]
+            i0, i1 = np.searchsorted(crescente, limites)
+            df = particao.iloc[validos - i1:validos - i0]
+        else:
+            df = self.armazem.carregar_usuario(usuario, [mes])
+            df = ordenar_viagens(tipar_viagens(df, self.catalogo)).dropna(subset=["dt"]) if not df.empty else df_vazio()
+        with self._lock:
+            # Uma escrita durante a leitura já invalidou o mês: não guarda o resultado velho
+            if self.versao_usuario(usuario) == versao: self._por_mes[chave] = df
+        return df
+
+    def viagens_mes_recente(self, usuario):
+        # O mês mais novo do usuário, o primeiro que o feed lê (quem tem viagem sem data entra
+        # no feed pela partição inteira: nada a antecipar por mês)
+        meses = self.meses_usuario(usuario)
+        if not meses or MES_SEM_DATA in meses: return df_vazio()
+        return self.viagens_mes(usuario, meses[0])
+
+    def viagens_de(self, usuarios):
+        for u in usuarios: self._garantir(u)
+        partes = [self._por_usuario[u] for u in usuarios if u in self._por_usuario]
+        return categorizar(pd.concat(partes, ignore_index=True)) if partes else df_vazio()
+
+    def usuarios(self): return list(self._usuarios)
+
+    def importar_csv(self, conteudo, usuario):
+        # A partição do usuário é descartada e relida (com o manifesto dele) na próxima visão
+        total = self.armazem.importar_csv(conteudo, usuario)
+        if not total: return 0
+        meses = self.armazem.carregar_manifesto(usuario)
+        with self._lock:
+            self._manifesto[usuario] = meses
+            if meses: self._usuarios.add(usuario)
+            for d in (self._por_usuario, self._stats, self._indices): d.pop(usuario, None)
+            self._por_mes = {chave: df for chave, df in self._por_mes.items() if chave[0] != usuario}
+            self.versao += 1
+            self._versoes[usuario] = self.versao
+        return total
+
+    def usuarios_recentes(self, n):
+        # Os n usuários com viagem no mês mais recente, entre os manifestos já lidos neste processo
+        # (nenhum arquivo é lido: ler o manifesto de todos custaria uma leitura por usuário)
+        with self._lock: meses = [(u, max((m for m in ms if m != MES_SEM_DATA), default="")) for u, ms in self._manifesto.items() if ms]
+        return [u for u, _ in heapq.nlargest(n, meses, key=lambda item: item[1])]
+
+    def estatisticas(self, usuario):
+        self._garantir(usuario)
+        return self._stats.get(usuario) or EstatisticasUsuario()
+
+    def adicionar(self, registro):
+        u = registro["usuario"]
+        self._garantir(u)
+        self._manifesto_usuario(u)
+        with self._lock:
+            novo = tipar_viagens(pd.DataFrame([registro], columns=COLUNAS), self.catalogo)
+            atual = self._por_usuario.get(u)
+            combinado = novo if atual is None else categorizar(pd.concat([atual, novo], ignore_index=True))
+            self._por_usuario[u] = ordenar_viagens(combinado)
+            meses = self._manifesto.setdefault(u, {})
+            self._usuarios.add(u)
+            mes = mes_da_viagem(registro.get("data"))
+            meses[mes] = meses.get(mes, 0) + 1
+            self._por_mes.pop((u, mes), None)
+            id_linha = int(novo["linha_id"].iloc[0])
+            self._stats.setdefault(u, EstatisticasUsuario()).aplicar(id_linha, int(self.catalogo.flags[id_linha]), novo["dt"].iloc[0])
+            self.versao += 1
+            self._versoes[u] = self.versao
+
+    def remover(self, u, id_viagem):
+        # Devolve a viagem removida (dict com as COLUNAS) ou None se u não tem viagem com esse id.
+        # O id só vale dentro do usuário: viagens importadas de outra conta podem repeti-lo
+        self._garantir(u)
+        with self._lock:
+            df = self._por_usuario.get(u)
+            if df is None: return None
+            alvo = df["id"] == id_viagem
+            if not alvo.any(): return None
+            removida = df[alvo].iloc[0]
+            id_linha = int(removida["linha_id"])
+            self._stats[u].aplicar(id_linha, int(self.catalogo.flags[id_linha]), removida["dt"], sinal=-1)
+            # Remover não altera a ordem das demais viagens: não precisa reordenar
+            restante = df[~alvo].reset_index(drop=True)
+            if restante.empty: del self._por_usuario[u]
+            else: self._por_usuario[u] = restante
+            meses = self._manifesto.get(u, {})
+            mes = mes_da_viagem(removida["data"])
+            self._por_mes.pop((u, mes), None)
+            if meses.get(mes, 0) > 1: meses[mes] -= 1
+            else: meses.pop(mes, None)
+            if not meses: self._usuarios.discard(u)
+            self.versao += 1
+            self._versoes[u] = self.versao
+            return {c: removida[c] for c in COLUNAS}